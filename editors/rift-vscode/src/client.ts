@@ -685,6 +685,11 @@ export class MorphLanguageClient
             payload && {}.hasOwnProperty.call(payload, "response")
                 ? payload.response
                 : undefined;
+        // streaming updates may carry only the text appended since the previous update.
+        const delta =
+            payload && {}.hasOwnProperty.call(payload, "delta")
+                ? payload.delta
+                : undefined;
 
         if (response)
             this.webviewState.update((state) => ({
@@ -698,6 +703,19 @@ export class MorphLanguageClient
                     },
                 },
             }));
+        else if (delta)
+            this.webviewState.update((state) => ({
+                ...state,
+                agents: {
+                    ...state.agents,
+                    [agent_id]: {
+                        ...state.agents[agent_id],
+                        streamingText:
+                            (state.agents[agent_id].streamingText ?? "") + delta,
+                        isStreaming: true,
+                    },
+                },
+            }));
 
         if (tasks) {
             this.webviewState.update((state) => ({
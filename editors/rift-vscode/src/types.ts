@@ -137,6 +137,8 @@ export interface RunAgentProgress {
 export type ChatAgentPayload =
   | {
       response?: string;
+      /** Text appended to the response since the previous progress update. */
+      delta?: string;
       done_streaming?: boolean;
     }
   | undefined;
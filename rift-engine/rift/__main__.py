@@ -1,5 +1,11 @@
-import fire
+import sys
 
 from rift.server.core import main
 
-fire.Fire(main)
+if len(sys.argv) > 1:
+    # fire is only needed to parse command line arguments.
+    import fire
+
+    fire.Fire(main)
+else:
+    main()
@@ -3,7 +3,18 @@ import logging
 from abc import ABC
 from dataclasses import dataclass, field
 from enum import Enum
-from typing import Any, ClassVar, Dict, List, Optional, Type
+from typing import (
+    Any,
+    AsyncIterable,
+    ClassVar,
+    Coroutine,
+    Dict,
+    List,
+    Optional,
+    Set,
+    Tuple,
+    Type,
+)
 
 from pydantic import BaseModel
 
@@ -101,6 +112,17 @@ class Agent:
     tasks: List[AgentTask] = field(default_factory=list)
     task: Optional[AgentTask] = None
     params_cls: Type[AgentParams] = AgentParams
+    models: ClassVar[Tuple[str, ...]] = ("chat_model", "completions_model")
+    """The server models the agent runs on; the agent is cancelled when one of them is reloaded."""
+    progress_interval: ClassVar[float] = 0.025
+    """Minimum number of seconds between the notifications sent by `send_progress_throttled`."""
+    _pending_progress: Any = field(default=None, init=False, repr=False)
+    _progress_pending: bool = field(default=False, init=False, repr=False)
+    _last_progress_time: float = field(default=float("-inf"), init=False, repr=False)
+    _progress_flush: Optional[asyncio.TimerHandle] = field(default=None, init=False, repr=False)
+    _progress_flush_task: Optional[asyncio.Task] = field(default=None, init=False, repr=False)
+    _children: Set[asyncio.Task] = field(default_factory=set, init=False, repr=False)
+    _last_tasks_progress: Optional[tuple] = field(default=None, init=False, repr=False)
 
     # def get_display(self):
     #     """Get agent display information"""
@@ -155,10 +177,30 @@ class Agent:
         # Return the created task
         return task
 
+    def spawn(self, coro: Coroutine) -> asyncio.Task:
+        """
+        Run `coro` as a background task that belongs to this agent.
+        The agent holds a reference to the task until it finishes and cancels it when the agent is cancelled,
+        so background workers don't outlive the agent that started them.
+        """
+        t = asyncio.create_task(coro)
+        self._children.add(t)
+        t.add_done_callback(self._children.discard)
+        return t
+
     async def cancel(self, msg: Optional[str] = None, send_progress=True):
         """
         Cancel all tasks and update progress. Assumes that `Agent.main()` has been called and that the main task has been created.
         """
+        # a throttled update held back from before the cancel must not reach the client afterwards.
+        self._progress_pending = False
+        if self._progress_flush is not None:
+            self._progress_flush.cancel()
+            self._progress_flush = None
+        flush_task = self._progress_flush_task
+        if flush_task is not None and flush_task is not asyncio.current_task():
+            flush_task.cancel()
+            self._progress_flush_task = None
         if self.task.cancelled:
             return
         logger.info(f"{self.agent_type} {self.agent_id} cancel run {msg or ''}")
@@ -166,6 +208,8 @@ class Agent:
         for task in self.tasks:
             if task is not None:
                 task.cancel()
+        for t in list(self._children):
+            t.cancel()
         if send_progress:
             await self.send_progress()
 
@@ -234,6 +278,24 @@ class Agent:
         Returns:
         This function does not return a value.
         """
+        # a throttled update that is still waiting to be sent is superseded by this one if it carries a payload;
+        # a tasks-only update doesn't replace it (eg the response so far), so it is sent along with the tasks.
+        if payload is None and self._progress_pending:
+            payload = self._pending_progress
+            if callable(payload):
+                payload = payload()
+        self._progress_pending = False
+        if self._progress_flush is not None:
+            self._progress_flush.cancel()
+            self._progress_flush = None
+        # one that is already on its way goes out first, so the client sees updates in order.
+        flush_task = self._progress_flush_task
+        if (
+            flush_task is not None
+            and not flush_task.done()
+            and flush_task is not asyncio.current_task()
+        ):
+            await flush_task
         # Check whether we're only sending payload or also tasks' data
         # logging.getLogger().info(f"sending progress with payload={payload}")
         if payload_only:
@@ -253,16 +315,27 @@ class Agent:
                 }
             # If unable to create tasks dictionary due to an exception, log the exception and set tasks to None
             except Exception as e:
-                logger.debug(f"Caught exception: {e}")
+                logger.debug("Caught exception: %s", e)
                 tasks = None
 
-        # Package all agent's progress into an AgentProgress object
-        progress = AgentProgress(
-            agent_type=self.agent_type,
-            agent_id=self.agent_id,
-            tasks=tasks,
-            payload=payload,
-        )
+        # A bare task update that matches the last one sent (eg the repeated calls at the end of `main`)
+        # tells the client nothing new, so skip it. Payloads may be mutated after sending, so they always go out.
+        if payload is None:
+            if self._last_tasks_progress == (tasks,):
+                return
+            self._last_tasks_progress = (tasks,)
+        else:
+            self._last_tasks_progress = None
+
+        # Package all agent's progress into the wire form of an AgentProgress. A plain dict is built directly,
+        # since this runs for every streamed update; like todict(AgentProgress(...)) it leaves out None fields.
+        progress = {"agent_type": self.agent_type}
+        if self.agent_id is not None:
+            progress["agent_id"] = self.agent_id
+        if tasks is not None:
+            progress["tasks"] = tasks
+        if payload is not None:
+            progress["payload"] = payload
 
         # If the main task's status is 'error', log it as an info level message
         if self.task.status == "error":
@@ -271,6 +344,70 @@ class Agent:
         # logger.info(f"{progress=}")
         await self.server.notify(f"morph/{self.agent_type}_{self.agent_id}_send_progress", progress)
 
+    async def send_progress_throttled(self, payload: Optional[Any] = None):
+        """
+        Like `send_progress`, but for streamed updates where each payload supersedes the previous one
+        (eg the response so far). Sending a notification per token is wasteful, so at most one
+        notification is sent every `progress_interval` seconds. A payload that arrives within the
+        interval is held back and sent when the interval is up, unless a newer update replaces it first.
+
+        The notifications are sent from a background task, so a slow client never holds up the caller
+        (eg the loop consuming a model's output stream); updates just pile up into the next one sent.
+
+        `payload` may also be a zero-argument function returning the payload. It is only called if
+        the update is actually sent, so building the payload (eg joining the response so far) is skipped for
+        updates that get superseded.
+        """
+        self._pending_progress = payload
+        self._progress_pending = True
+        if self._progress_flush is not None:
+            return
+        flush_task = self._progress_flush_task
+        if flush_task is not None and not flush_task.done():
+            # the task sending the previous update picks this one up when it is done.
+            return
+        loop = asyncio.get_running_loop()
+        due = self._last_progress_time + self.progress_interval
+        self._progress_flush = loop.call_at(max(due, loop.time()), self._flush_progress)
+
+    async def accumulate_response(self, deltas: AsyncIterable[str], response: str = "") -> str:
+        """
+        Appends the text `deltas` to `response`, sending `{"response": <the response so far>}` with
+        `send_progress_throttled` as they arrive, and returns the whole response.
+
+        The deltas are kept in a list that is only joined when an update is actually sent, so a long
+        response isn't copied again for every delta.
+        """
+        parts = [response]
+
+        def progress() -> dict:
+            parts[:] = ["".join(parts)]
+            return {"response": parts[0]}
+
+        async for delta in deltas:
+            parts.append(delta)
+            await self.send_progress_throttled(progress)
+        return "".join(parts)
+
+    def _flush_progress(self):
+        self._progress_flush = None
+        self._progress_flush_task = asyncio.create_task(self._send_pending_progress())
+
+    async def _send_pending_progress(self):
+        loop = asyncio.get_running_loop()
+        while self._progress_pending:
+            delay = self._last_progress_time + self.progress_interval - loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+                if not self._progress_pending:
+                    break
+            self._progress_pending = False
+            self._last_progress_time = loop.time()
+            payload = self._pending_progress
+            if callable(payload):
+                payload = payload()
+            await self.send_progress(payload)
+
     async def main(self):
         """
         The main method called by the LSP server to handle method `morph/run`.
@@ -391,6 +528,8 @@ class AgentRegistry:
 
     # Initial registry to store agents
     registry: Dict[str, AgentRegistryItem] = field(default_factory=dict)
+    # built lazily by list_agents and dropped whenever an agent is registered.
+    _listing: Optional[List[AgentRegistryResult]] = field(default=None, init=False, repr=False)
 
     def __getitem__(self, key):
         return self.get_agent(key)
@@ -410,6 +549,7 @@ class AgentRegistry:
             display_name=display_name,
             agent_icon=agent_icon,
         )
+        self._listing = None
 
     def get_agent(self, agent_type: str) -> Type[Agent]:
         result: AgentRegistryItem | None = self.registry.get(agent_type)
@@ -422,15 +562,18 @@ class AgentRegistry:
         return None  # TODO
 
     def list_agents(self) -> List[AgentRegistryResult]:
-        return [
-            AgentRegistryResult(
-                agent_type=item.agent.agent_type,
-                agent_description=item.agent_description,
-                agent_icon=item.agent_icon,
-                display_name=item.display_name,
-            )
-            for item in self.registry.values()
-        ]
+        """Returns the registered agents. The list is shared between callers and must not be mutated."""
+        if self._listing is None:
+            self._listing = [
+                AgentRegistryResult(
+                    agent_type=item.agent.agent_type,
+                    agent_description=item.agent_description,
+                    agent_icon=item.agent_icon,
+                    display_name=item.display_name,
+                )
+                for item in self.registry.values()
+            ]
+        return self._listing
 
 
 AGENT_REGISTRY = AgentRegistry()  # Creating an instance of AgentRegistry
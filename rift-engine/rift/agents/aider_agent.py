@@ -119,9 +119,9 @@ class Aider(agent.ThirdPartyAgent):
         before, after = response_stream.split_once("感")
         try:
             async with self.state.response_lock:
-                async for delta in before:
-                    self._response_buffer += delta
-                    await self.send_progress({"response": self._response_buffer})
+                self._response_buffer = await self.accumulate_response(
+                    before, self._response_buffer
+                )
             await asyncio.sleep(0.1)
             await self._run_chat_thread(after)
         except Exception as e:
@@ -137,7 +137,7 @@ class Aider(agent.ThirdPartyAgent):
 
         response_stream = TextStream()
 
-        run_chat_thread_task = asyncio.create_task(self._run_chat_thread(response_stream))
+        run_chat_thread_task = self.spawn(self._run_chat_thread(response_stream))
 
         loop = asyncio.get_running_loop()
 
@@ -2,7 +2,9 @@ import asyncio
 import logging
 from asyncio import Future
 from dataclasses import dataclass, field
-from typing import Any, ClassVar, Dict, Optional
+from typing import Any, ClassVar, Dict, Optional, Tuple
+
+from diff_match_patch import diff_match_patch
 
 import rift.agents.registry as registry
 import rift.llm.openai_types as openai
@@ -16,6 +18,17 @@ from rift.util.TextStream import TextStream
 
 logger = logging.getLogger(__name__)
 
+# diff_match_patch only keeps its tuning parameters on the instance, so every edit shares one.
+_dmp = diff_match_patch()
+
+
+def add_pos_text(pos: lsp.Position, text: str) -> lsp.Position:
+    """Returns the position at the end of `text` when it is inserted at `pos`."""
+    line_delta = text.count("\n")
+    if line_delta == 0:
+        return lsp.Position(pos.line, pos.character + len(text))
+    return lsp.Position(pos.line + line_delta, len(text) - text.rindex("\n") - 1)
+
 
 # dataclass for representing the result of the code completion agent run
 @dataclass
@@ -67,6 +80,7 @@ class CodeEditAgent(Agent):
     state: CodeEditAgentState
     agent_type: ClassVar[str] = "code_edit"
     params_cls: ClassVar[Any] = CodeEditAgentParams
+    models: ClassVar[Tuple[str, ...]] = ("completions_model",)
 
     @classmethod
     async def create(cls, params: CodeEditAgentParams, server):
@@ -74,7 +88,7 @@ class CodeEditAgent(Agent):
         model = await server.ensure_completions_model()  # TODO: not right, fix
         state = CodeEditAgentState(
             model=model,
-            document=server.documents[params.textDocument.uri],
+            document=await server.get_document(params.textDocument.uri),
             active_range=lsp.Range(params.selection.start, params.selection.end),
             cursor=params.selection.second,  # begin at the start of the selection
             additive_ranges=RangeSet(),
@@ -127,9 +141,6 @@ class CodeEditAgent(Agent):
                         break
                     documents = resolve_inline_uris(instructionPrompt, self.server)
                     self.server.register_change_callback(self.on_change, self.state.document.uri)
-                    from diff_match_patch import diff_match_patch
-
-                    dmp = diff_match_patch()
                     edit_code_result = await self.state.model.edit_code(
                         urtext,
                         uroffset_start,
@@ -144,15 +155,22 @@ class CodeEditAgent(Agent):
                     response_stream = TextStream()
 
                     async def generate_response():
-                        response = ""
+                        # the deltas are only joined when an update is actually sent.
+                        parts = []
+
+                        def progress() -> CodeEditProgress:
+                            parts[:] = ["".join(parts)]
+                            return CodeEditProgress(response=parts[0])
+
                         try:
                             async for delta in response_stream:
-                                response += delta
-                                await self.send_progress(CodeEditProgress(response=response))
+                                parts.append(delta)
+                                await self.send_progress_throttled(progress)
                         except Exception as e:
                             logger.info(f"RESPONSE EXCEPTION: {e}")
                             raise e
                         finally:
+                            response = "".join(parts)
                             await self.send_progress({"response": response, "done_streaming": True})
                         return response
 
@@ -191,16 +209,16 @@ class CodeEditAgent(Agent):
                                 # # dmp.diff_cleanupSemantic(diff)
                                 # dmp.diff_cleanupMerge
 
-                                (x, y, linearray) = dmp.diff_linesToChars(
+                                (x, y, linearray) = _dmp.diff_linesToChars(
                                     self.selection_text, new_text
                                 )
 
-                                diff = dmp.diff_main(x, y, False)
+                                diff = _dmp.diff_main(x, y, False)
 
                                 # Convert the diff back to original text.
-                                dmp.diff_charsToLines(diff, linearray)
+                                _dmp.diff_charsToLines(diff, linearray)
                                 # Eliminate freak matches (e.g. blank lines)
-                                dmp.diff_cleanupSemantic(diff)
+                                _dmp.diff_cleanupSemantic(diff)
 
                                 self.DIFF = diff  # store the latest diff
                                 # logger.info(f"{diff=}")
@@ -216,14 +234,6 @@ class CodeEditAgent(Agent):
                                     self.state.document.uri, self.RANGE, diff_text
                                 )
 
-                                def add_pos_text(pos: lsp.Position, text: str):
-                                    line_delta = text.count("\n")
-                                    if line_delta == 0:
-                                        offset = pos.character + len(text)
-                                    else:
-                                        offset = list(reversed(text)).index("\n")
-                                    return lsp.Position(pos.line + line_delta, offset)
-
                                 self.RANGE = lsp.Range(
                                     self.state.selection.first,
                                     add_pos_text(self.state.selection.first, diff_text),
@@ -263,7 +273,7 @@ class CodeEditAgent(Agent):
                                     )
                                     await self.send_progress(progress)
                             except Exception as e:
-                                logger.info(f"caught {e=} retrying")
+                                logger.info("caught e=%r retrying", e)
                                 fuel -= 1
 
                     async def generate_code():
@@ -275,10 +285,19 @@ class CodeEditAgent(Agent):
                         async def _watch_queue():
                             while True:
                                 x = await diff_queue.get()
-                                if x is None:
-                                    return
-                                else:
+                                # Each queued text replaces the whole range, so while an edit was
+                                # in flight only the newest text is still worth sending.
+                                eof = x is None
+                                while not eof and not diff_queue.empty():
+                                    y = diff_queue.get_nowait()
+                                    if y is None:
+                                        eof = True
+                                    else:
+                                        x = y
+                                if x is not None:
                                     await send_diff(x)
+                                if eof:
+                                    return
 
                         diff_queue_task = asyncio.create_task(_watch_queue())
                         while True:
@@ -355,6 +374,8 @@ class CodeEditAgent(Agent):
         """
         assert changes.textDocument.uri == self.state.document.uri
         self.state.document = before
+        # edits made by someone else; these are applied to our ranges together once all changes are seen.
+        their_edits = []
         for c in changes.contentChanges:
             # logger.info(f"contentChange: {c=}")
             # fut = self.state.change_futures.get(c.text)
@@ -362,6 +383,7 @@ class CodeEditAgent(Agent):
             for span, vfut in self.state.change_futures.items():
                 if c.text in span:
                     fut = vfut
+                    break
 
             if fut is not None:
                 # we caused this change
@@ -372,8 +394,7 @@ class CodeEditAgent(Agent):
             else:
                 # someone else caused this change
                 # [todo], in the below examples, we shouldn't cancel, but instead figure out what changed and restart the insertions with the new information.
-                with lsp.setdoc(self.state.document):
-                    self.state.additive_ranges.apply_edit(c)
+                their_edits.append(c)
                 if c.range is None:
                     await self.cancel("the whole document got replaced")
                 else:
@@ -392,21 +413,15 @@ class CodeEditAgent(Agent):
                     elif self.state.cursor in c.range:
                         await self.cancel("someone is editing the same text as us")
 
+        self.state.additive_ranges.apply_edits(their_edits)
         self.state.document = after
 
     async def send_result(self, result):
         ...  # unreachable
 
     def accepted_diff_text(self, diff):
-        result = ""
-        for op, text in diff:
-            if op == -1:  # remove
-                pass
-            elif op == 0:
-                result += text
-            elif op == 1:
-                result += text
-        return result
+        # keeps and additions make up the accepted text; removals (op == -1) are dropped.
+        return "".join([text for op, text in diff if op != -1])
 
     async def accept(self):
         logger.info(f"{self} user accepted result")
@@ -280,7 +280,7 @@ class EngineerAgent(ThirdPartyAgent):
             async def _step_task(event: asyncio.Event):
                 await event.wait()
 
-            _ = asyncio.create_task(
+            _ = self.spawn(
                 self.add_task(description=step.__name__, task=_step_task, args=[event]).run()
             )
 
@@ -321,9 +321,7 @@ class EngineerAgent(ThirdPartyAgent):
         before, after = response_stream.split_once("感")
         try:
             async with response_lock:
-                async for delta in before:
-                    self.RESPONSE += delta
-                    await self.send_progress(dict(response=self.RESPONSE))
+                self.RESPONSE = await self.accumulate_response(before, self.RESPONSE)
             await self._run_chat_thread(after)
         except Exception as e:
             logger.info(f"[_run_chat_thread] caught exception={e}, exiting")
@@ -346,7 +344,7 @@ class EngineerAgent(ThirdPartyAgent):
         self.RESPONSE = ""
         self.response_stream = TextStream()
         await self.send_progress()
-        asyncio.create_task(self._run_chat_thread(self.response_stream))
+        self.spawn(self._run_chat_thread(self.response_stream))
 
         async def get_prompt():
             prompt = await self.request_chat(RequestChatRequest(messages=self.state.messages))
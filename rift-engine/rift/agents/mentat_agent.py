@@ -83,9 +83,9 @@ class Mentat(agent.Agent):
         before, after = response_stream.split_once("感")
         try:
             async with self.state.response_lock:
-                async for delta in before:
-                    self.state._response_buffer += delta
-                    await self.send_progress({"response": self.state._response_buffer})
+                self.state._response_buffer = await self.accumulate_response(
+                    before, self.state._response_buffer
+                )
             await asyncio.sleep(0.1)
             await self._run_chat_thread(after)
         except Exception as e:
@@ -94,7 +94,7 @@ class Mentat(agent.Agent):
     async def run(self) -> MentatRunResult:
         response_stream = TextStream()
 
-        run_chat_thread_task = asyncio.create_task(self._run_chat_thread(response_stream))
+        run_chat_thread_task = self.spawn(self._run_chat_thread(response_stream))
 
         loop = asyncio.get_running_loop()
 
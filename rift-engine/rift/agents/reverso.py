@@ -9,6 +9,7 @@ import rift.lsp.types as lsp
 from rift.agents.abstract import AgentProgress  # AgentTask,
 from rift.agents.abstract import Agent, AgentParams, AgentRunResult, AgentState, agent
 from rift.server.selection import RangeSet
+from rift.util import asyncgen
 from rift.util.TextStream import TextStream
 
 logger = logging.getLogger(__name__)
@@ -63,7 +64,7 @@ class ReversoAgent(Agent):
     @classmethod
     async def create(cls, params: Dict[Any, Any], server):
         state = ReversoAgentState(
-            document=server.documents[params.textDocument.uri],
+            document=await server.get_document(params.textDocument.uri),
             active_range=lsp.Range(params.selection.start, params.selection.end),
             cursor=params.selection.second,  # begin at the start of the selection
             additive_ranges=RangeSet(),
@@ -124,14 +125,15 @@ def quicksort(nums: List[int]) -> List[int]:
         offset_start = self.state.document.position_to_offset(self.state.selection.first)
         offset_end = self.state.document.position_to_offset(self.state.selection.second)
         selection_text = self.state.document.text[offset_start:offset_end]
-        async for delta in text_stream:
-            logger.info(f"DELTA: {delta=}")
+        # every delta costs a diff and an edit round-trip to the editor, so batch up small ones.
+        async for delta in asyncgen.coalesce(text_stream):
+            logger.debug("DELTA: delta=%r", delta)
             fuel = 10
             while True:
                 if fuel <= 0:
                     raise Exception(":(")
                 try:
-                    logger.info("in main try")
+                    logger.debug("in main try")
                     # assumption: RANGE is always the range of the last valid selection
                     all_deltas.append(delta)
                     new_text = "".join(all_deltas)
@@ -142,16 +144,16 @@ def quicksort(nums: List[int]) -> List[int]:
 
                     diff = dmp.diff_lineMode(selection_text, new_text, None)
                     dmp.diff_cleanupSemantic(diff)
-                    logger.info(f"{diff=}")
+                    logger.debug("diff=%r", diff)
                     diff_text = "".join([text for _, text in diff])
 
-                    logger.info(f"got the diff_text: {diff_text}")
+                    logger.debug("got the diff_text: %s", diff_text)
 
                     # set the stage to update the document and ranges
                     cf = asyncio.get_running_loop().create_future()
                     self.state.change_futures[diff_text] = cf
 
-                    logger.info(f"VALS {RANGE=} {diff_text=}")
+                    logger.debug("VALS RANGE=%r diff_text=%r", RANGE, diff_text)
                     # refresh the displayed text
                     await self.server.apply_range_edit(self.state.document.uri, RANGE, diff_text)
 
@@ -159,17 +161,15 @@ def quicksort(nums: List[int]) -> List[int]:
                     with lsp.setdoc(self.state.document):
                         cursor = self.state.selection.first
                         for op, text in diff:
+                            # each step is an offset round-trip through the document, so only do it once.
+                            next_cursor = cursor + len(text)
                             if op == -1:  # delete
-                                self.state.negative_ranges.add(
-                                    lsp.Range(cursor, cursor + len(text))
-                                )
+                                self.state.negative_ranges.add(lsp.Range(cursor, next_cursor))
                             elif op == 0:  # keep
                                 pass
                             elif op == 1:  # add
-                                self.state.additive_ranges.add(
-                                    lsp.Range(cursor, cursor + len(text))
-                                )
-                            cursor += len(text)
+                                self.state.additive_ranges.add(lsp.Range(cursor, next_cursor))
+                            cursor = next_cursor
 
                     self.send_progress(
                         ReversoProgress(
@@ -196,7 +196,7 @@ def quicksort(nums: List[int]) -> List[int]:
                     finally:
                         del self.state.change_futures[diff_text]
                 except Exception as e:
-                    logger.info(f"caught {e=} retrying")
+                    logger.info("caught e=%r retrying", e)
                     fuel -= 1
 
             # correct the range
@@ -496,6 +496,8 @@ really want something like
         """
         assert changes.textDocument.uri == self.state.document.uri
         self.state.document = before
+        # edits made by someone else; these are applied to our ranges together once all changes are seen.
+        their_edits = []
         for c in changes.contentChanges:
             # logger.info(f"contentChange: {c=}")
             # fut = self.state.change_futures.get(c.text)
@@ -503,6 +505,7 @@ really want something like
             for span, vfut in self.state.change_futures.items():
                 if c.text in span:
                     fut = vfut
+                    break
 
             if fut is not None:
                 # we caused this change
@@ -510,8 +513,7 @@ really want something like
             else:
                 # someone else caused this change
                 # [todo], in the below examples, we shouldn't cancel, but instead figure out what changed and restart the insertions with the new information.
-                with lsp.setdoc(self.state.document):
-                    self.state.additive_ranges.apply_edit(c)
+                their_edits.append(c)
                 if c.range is None:
                     await self.cancel("the whole document got replaced")
                 else:
@@ -530,6 +532,7 @@ really want something like
                     elif self.state.cursor in c.range:
                         await self.cancel("someone is editing the same text as us")
 
+        self.state.additive_ranges.apply_edits(their_edits)
         self.state.document = after
 
     async def send_result(self, result):
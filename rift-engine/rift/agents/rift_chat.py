@@ -1,8 +1,7 @@
 import asyncio
 import logging
-from asyncio import Lock
 from dataclasses import dataclass
-from typing import Any, ClassVar, List, Optional
+from typing import Any, ClassVar, List, Optional, Tuple
 
 from tqdm import tqdm
 
@@ -34,6 +33,9 @@ class ChatProgress(
     AgentProgress
 ):  # reports what tasks are active and responsible for reporting new tasks
     response: Optional[str] = None
+    delta: Optional[str] = None
+    """The text appended to the response since the previous progress update.
+    While streaming only this is sent; the full `response` is sent with `done_streaming`."""
     done_streaming: bool = False
 
 
@@ -54,6 +56,7 @@ class RiftChatAgent(Agent):
     state: Optional[RiftChatAgentState] = None
     agent_type: ClassVar[str] = "rift_chat"
     params_cls: ClassVar[Any] = RiftChatAgentParams
+    models: ClassVar[Tuple[str, ...]] = ("chat_model",)
 
     @classmethod
     async def create(cls, params: AgentParams, server: BaseLspServer):
@@ -62,7 +65,7 @@ class RiftChatAgent(Agent):
         if params.textDocument is None:
             document = None
         else:
-            document = server.documents[params.textDocument.uri]
+            document = await server.get_document(params.textDocument.uri)
         state = RiftChatAgentState(
             model=model,
             messages=[openai.Message.assistant("Hello! How can I help you today?")],
@@ -77,8 +80,6 @@ class RiftChatAgent(Agent):
         return obj
 
     async def run(self) -> AgentRunResult:
-        response_lock = Lock()
-
         async def get_user_response() -> str:
             # logger.info(f"getting user response for {self.state.messages=}")
             result = await self.request_chat(RequestChatRequest(messages=self.state.messages))
@@ -87,7 +88,8 @@ class RiftChatAgent(Agent):
 
         async def generate_response(user_response: str):
             # logger.info(f"generating response for {user_response=}")
-            response = ""
+            # progress updates carry just the new text, so the whole response is only joined at the end.
+            chunks: List[str] = []
             documents: List[lsp.Document] = resolve_inline_uris(user_response, self.server)
             logger.info(f"resolved document uris {documents=}")
 
@@ -101,11 +103,21 @@ class RiftChatAgent(Agent):
                 cursor_offset=None,
                 documents=documents,
             )
+            sent = 0
+
+            def progress() -> dict:
+                # called only when an update is actually sent, so the deltas since the last one are never lost.
+                # the wire form of ChatProgress(delta=delta), without building the dataclass per update.
+                nonlocal sent
+                delta = "".join(chunks[sent:])
+                sent = len(chunks)
+                return {"delta": delta}
+
             async for delta in stream.text:
-                response += delta
+                chunks.append(delta)
                 # logger.info(f"{delta=}")
-                async with response_lock:
-                    await self.send_progress(ChatProgress(response=response))
+                await self.send_progress_throttled(progress)
+            response = "".join(chunks)
             await self.send_progress(ChatProgress(response=response, done_streaming=True))
             logger.info(f"{self} finished streaming response.")
             return response
@@ -136,14 +148,12 @@ class RiftChatAgent(Agent):
 
             user_response = await user_response_task
 
-            async with response_lock:
-                self.state.messages.append(openai.Message.user(content=user_response))
+            self.state.messages.append(openai.Message.user(content=user_response))
             self.set_tasks([get_user_response_task, generate_response_task])
             await self.send_progress()
             assistant_response = await generate_response_task.run()
             await self.send_progress()
-            async with response_lock:
-                self.state.messages.append(openai.Message.assistant(content=assistant_response))
+            self.state.messages.append(openai.Message.assistant(content=assistant_response))
 
             old_generate_response_task = generate_response_task
             await self.send_progress()
@@ -108,10 +108,9 @@ class SmolAgent(ThirdPartyAgent):
         before, after = response_stream.split_once("感")
         try:
             async with self.state.response_lock:
-                async for delta in before:
-                    # logger.info(f"{delta=}")
-                    self._response_buffer += delta
-                    await self.send_progress({"response": self._response_buffer})
+                self._response_buffer = await self.accumulate_response(
+                    before, self._response_buffer
+                )
             await asyncio.sleep(0.1)
             await self._run_chat_thread(after)
         except Exception as e:
@@ -121,7 +120,7 @@ class SmolAgent(ThirdPartyAgent):
         await self.send_progress()
         response_stream = TextStream()
         self._response_buffer = ""
-        asyncio.create_task(self._run_chat_thread(response_stream))
+        self.spawn(self._run_chat_thread(response_stream))
         loop = asyncio.get_running_loop()
 
         def send_chat_update_wrapper(prompt: str = "感", end="", eof=False):
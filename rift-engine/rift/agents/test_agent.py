@@ -84,9 +84,9 @@ class TestAgent(Agent):
 
         try:
             async with self.state.response_lock:
-                async for delta in before:
-                    self._response_buffer += delta
-                    await self.send_progress({"response": self._response_buffer})
+                self._response_buffer = await self.accumulate_response(
+                    before, self._response_buffer
+                )
 
             await asyncio.sleep(0.1)
 
@@ -18,6 +18,14 @@ class ModelConfig(BaseModel):
     def __eq__(self, other):
         return hash(self) == hash(other)
 
+    def chat_key(self) -> Tuple[str]:
+        """The part of the config that `create_chat` depends on, matching the `create_client` cache."""
+        return (self.chatModel,)
+
+    def completions_key(self) -> Tuple[str]:
+        """The part of the config that `create_completions` depends on, matching the `create_client` cache."""
+        return (self.completionsModel,)
+
     def create_chat(self) -> AbstractChatCompletionProvider:
         c = create_client(self.chatModel, self.openaiKey)
         assert isinstance(c, AbstractChatCompletionProvider)
@@ -56,6 +64,7 @@ def create_client(
         return client
 
 
+@functools.lru_cache(maxsize=64)
 def parse_type_name_path(config: str) -> Tuple[str, str, str]:
     assert ":" in config, f"Invalid config: {config}"
     type, rest = config.split(":", 1)
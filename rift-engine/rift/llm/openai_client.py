@@ -24,7 +24,6 @@ import aiohttp
 from pydantic import BaseModel, BaseSettings, SecretStr
 
 import rift.lsp.types as lsp
-import rift.util.asyncgen as asg
 from rift.llm.abstract import (
     AbstractChatCompletionProvider,
     AbstractCodeCompletionProvider,
@@ -68,6 +67,14 @@ def get_num_tokens(content: str):
     return len(ENCODER.encode(content))
 
 
+def extract_delta_text(raw: str) -> str:
+    """Project a streamed chat completion event onto its delta text.
+
+    Equivalent to `ChatCompletionChunk.parse_raw(raw).text` without building the pydantic model.
+    """
+    return json.loads(raw)["choices"][0]["delta"].get("content") or ""
+
+
 def message_size(msg: Message):
     with ENCODER_LOCK:
         length = get_num_tokens(msg.content)
@@ -202,7 +209,7 @@ def truncate_around_region(
     else:
         # if there is no cursor offset provided, simply take the last max_size tokens
         tokens = document_tokens[-max_size:]
-        logger.debug(f"Truncating document to last {len(tokens)} tokens")
+        logger.debug("Truncating document to last %d tokens", len(tokens))
     return tokens
 
 
@@ -249,7 +256,7 @@ def create_system_message_chat_truncated(
             if len(tokens) > max_document_list_size:
                 tokens = tokens[:max_document_list_size]
                 logger.info("truncated tokens")
-                logger.debug(f"Truncating document to first {len(tokens)} tokens")
+                logger.debug("Truncating document to first %d tokens", len(tokens))
             logger.info("creating new doc")
             new_doc = lsp.Document(doc.uri, document=lsp.DocumentContext(ENCODER.decode(tokens)))
             logger.info("created new doc")
@@ -352,13 +359,10 @@ class OpenAIClient(BaseSettings, AbstractCodeCompletionProvider, AbstractChatCom
     def _make_path(self, endpoint: str) -> str:
         return self.url_path + endpoint
 
-    async def _post_streaming(
-        self,
-        endpoint: str,
-        params: I,
-        input_type: Type[I],
-        stream_data_type: Type[O],
-    ) -> AsyncGenerator[O, None]:
+    async def _stream_events(
+        self, endpoint: str, params: I, input_type: Type[I]
+    ) -> AsyncGenerator[str, None]:
+        """Yields the raw JSON payload of each server-sent event until `[DONE]`."""
         if not getattr(params, "stream", True):
             raise ValueError("To not use streaming please use the _post_endpoint method")
         if not isinstance(params, input_type):
@@ -381,11 +385,20 @@ class OpenAIClient(BaseSettings, AbstractCodeCompletionProvider, AbstractChatCom
                     line = line.strip()
                     if line == "[DONE]":
                         break
-                    data = stream_data_type.parse_raw(line)
-                    yield data
+                    yield line
                 else:
                     raise ValueError(f"unrecognised stream line: {line}")
 
+    async def _post_streaming(
+        self,
+        endpoint: str,
+        params: I,
+        input_type: Type[I],
+        stream_data_type: Type[O],
+    ) -> AsyncGenerator[O, None]:
+        async for line in self._stream_events(endpoint, params, input_type):
+            yield stream_data_type.parse_raw(line)
+
     async def _post_endpoint(
         self,
         endpoint: str,
@@ -419,10 +432,7 @@ class OpenAIClient(BaseSettings, AbstractCodeCompletionProvider, AbstractChatCom
     ) -> Coroutine[Any, Any, ChatCompletionResponse]:
         ...
 
-    def chat_completions(self, messages: List[Message], *, stream: bool = False, **kwargs) -> Any:
-        # logger.info(f"{messages=}")
-        endpoint = "/chat/completions"
-        input_type = ChatCompletionRequest
+    def _chat_completion_params(self, messages: List[Message], stream: bool, **kwargs):
         # TODO: don't hardcode
         logit_bias = {99750: -100}  # forbid repetition of the cursor sentinel
         params = ChatCompletionRequest(
@@ -434,6 +444,13 @@ class OpenAIClient(BaseSettings, AbstractCodeCompletionProvider, AbstractChatCom
         )
         if self.default_model:
             params.model = self.default_model
+        return params
+
+    def chat_completions(self, messages: List[Message], *, stream: bool = False, **kwargs) -> Any:
+        # logger.info(f"{messages=}")
+        endpoint = "/chat/completions"
+        input_type = ChatCompletionRequest
+        params = self._chat_completion_params(messages, stream, **kwargs)
         output_type = ChatCompletionResponse
 
         if stream:
@@ -448,6 +465,14 @@ class OpenAIClient(BaseSettings, AbstractCodeCompletionProvider, AbstractChatCom
                 endpoint, params=params, input_type=input_type, output_type=output_type
             )
 
+    async def chat_completions_text(
+        self, messages: List[Message], **kwargs
+    ) -> AsyncGenerator[str, None]:
+        """Streams only the delta text of a chat completion, skipping `ChatCompletionChunk` validation."""
+        params = self._chat_completion_params(messages, True, **kwargs)
+        async for line in self._stream_events("/chat/completions", params, ChatCompletionRequest):
+            yield extract_delta_text(line)
+
     async def run_chat(
         self,
         document: Optional[str],
@@ -481,9 +506,7 @@ class OpenAIClient(BaseSettings, AbstractCodeCompletionProvider, AbstractChatCom
             f"Truncated {num_old_messages - len(messages)} non-system messages due to context length overflow."
         )
 
-        stream = TextStream.from_aiter(
-            asg.map(lambda c: c.text, self.chat_completions(messages, stream=True))
-        )
+        stream = TextStream.from_aiter(self.chat_completions_text(messages))
 
         async def worker():
             try:
@@ -607,7 +630,7 @@ class OpenAIClient(BaseSettings, AbstractCodeCompletionProvider, AbstractChatCom
                 tokens = ENCODER.encode(doc.document.text)
                 if len(tokens) > max_document_list_size:
                     tokens = tokens[:max_document_list_size]
-                    logger.debug(f"Truncating document to first {len(tokens)} tokens")
+                    logger.debug("Truncating document to first %d tokens", len(tokens))
                 doc = lsp.Document(
                     uri=doc.uri, document=lsp.DocumentContext(ENCODER.decode(tokens))
                 )
@@ -621,9 +644,7 @@ class OpenAIClient(BaseSettings, AbstractCodeCompletionProvider, AbstractChatCom
         )
         # logger.info(f"{messages=}")
 
-        stream = TextStream.from_aiter(
-            asg.map(lambda c: c.text, self.chat_completions(messages, stream=True))
-        )
+        stream = TextStream.from_aiter(self.chat_completions_text(messages))
 
         logger.info("constructed stream")
         # logger.info(f"{stream=}")
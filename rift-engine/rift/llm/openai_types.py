@@ -1,15 +1,22 @@
+import sys
 import textwrap
 from abc import ABC, abstractmethod
 from datetime import datetime
 from typing import Any, Literal, Optional, Union
 
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, validator
 
 """ Type definitions for interacting with the OpenAI API """
 
 MessageRole = Literal["system", "user", "assistant"]
 FinishReason = Literal["stop", "length", "content_filter"]
 
+_VALID_ROLES = frozenset(("system", "user", "assistant"))
+
+# `Literal` fields are already canonicalised by pydantic's literal validator; plain `str`
+# fields carrying the same values are interned here so they share storage and compare by identity.
+_FINISH_INTERN = {r: sys.intern(r) for r in ("stop", "length", "content_filter")}
+
 
 class Message(BaseModel):
     """OpenAI chat message.
@@ -24,10 +31,9 @@ class Message(BaseModel):
 
     @classmethod
     def mk(cls, role: str, content: str):
-        if role in ["system", "user", "assistant"]:
+        if role in _VALID_ROLES:
             return cls(role=role, content=content, name=None)  # type: ignore
-        else:
-            return cls(role="system", content=content, name=role)
+        return cls(role="system", content=content, name=role)
 
     @classmethod
     def user(cls, content: str) -> "Message":
@@ -164,6 +170,12 @@ class TextChoice(BaseModel):
     logprobs: Optional[Any] = Field(default=None)
     finish_reason: Optional[str] = Field(default=None)
 
+    @validator("finish_reason")
+    def _intern_finish_reason(cls, v):
+        if v is None:
+            return v
+        return _FINISH_INTERN.get(v, v)
+
 
 class TextCompletionResponse(BaseModel):
     id: str
@@ -1,27 +1,56 @@
-from abc import ABC, abstractmethod, abstractproperty
-from dataclasses import dataclass
+import os
+from bisect import bisect_right
+from functools import lru_cache
+from itertools import accumulate
 from typing import Callable, List, Optional, Tuple
 
-from tiktoken import get_encoding
-
 from rift.llm.openai_types import Message, MessageRole
 
-ENCODER = get_encoding("cl100k_base")
+# Prompt text is user code and chat, so everything here is encoded as ordinary text: this skips
+# tiktoken's special-token scan, and a literal "<|endoftext|>" in a file is tokenized as text
+# instead of raising.
+_encoder = None
+
+
+def _get_encoder():
+    """Loads the cl100k_base encoding on first use, so importing this module stays cheap."""
+    global _encoder
+    if _encoder is None:
+        from tiktoken import get_encoding
 
+        _encoder = get_encoding("cl100k_base")
+    return _encoder
 
+
+@lru_cache(maxsize=4096)
 def token_length(string: str) -> int:
-    return len(ENCODER.encode(string))
+    return len(_get_encoder().encode_ordinary(string))
+
 
+@lru_cache(maxsize=4096)
+def _encode(string: str) -> Tuple[int, ...]:
+    """Cached encoding for short strings that recur across prompts, such as separators."""
+    return tuple(_get_encoder().encode_ordinary(string))
+
+
+class Prompt:
+    __slots__ = ("size",)
 
-class Prompt(ABC):
     def __init__(self, size: int) -> None:
         self.size = size
 
-    @abstractmethod
     def fit(self, max_size: int) -> Optional[Tuple[str, int]]:
+        fitted = self.fit_tokens(max_size)
+        if fitted is None:
+            return None
+        tokens, size = fitted
+        return _get_encoder().decode(tokens), size
+
+    def fit_tokens(self, max_size: int) -> Optional[Tuple[List[int], int]]:
+        """Like `fit`, but returns the token ids so that composite prompts only decode once."""
         raise NotImplementedError
 
-    @abstractproperty
+    @property
     def min_size(self) -> int:
         raise NotImplementedError
 
@@ -31,14 +60,16 @@ class Prompt(ABC):
     def __or__(self, other) -> "EitherPrompt":
         return EitherPrompt(self, other)
 
-    @abstractmethod
     def __str__(self) -> str:
         raise NotImplementedError
 
 
 class StringPrompt(Prompt):
+    __slots__ = ("string", "_tokens")
+
     def __init__(self, string: str) -> None:
-        super().__init__(token_length(string))
+        self._tokens = _get_encoder().encode_ordinary(string)
+        super().__init__(len(self._tokens))
         self.string = string
 
     def fit(self, max_size: int) -> Optional[Tuple[str, int]]:
@@ -46,6 +77,11 @@ class StringPrompt(Prompt):
             return self.string, self.size
         return None
 
+    def fit_tokens(self, max_size: int) -> Optional[Tuple[List[int], int]]:
+        if self.size <= max_size:
+            return self._tokens, self.size
+        return None
+
     @property
     def min_size(self) -> int:
         return self.size
@@ -55,30 +91,53 @@ class StringPrompt(Prompt):
 
 
 class SplitStringPrompt(Prompt):
+    __slots__ = (
+        "string1",
+        "string2",
+        "separator",
+        "min_size_",
+        "_tokens_lhs",
+        "_tokens_rhs",
+        "_tokens_separator",
+        "_string",
+    )
+
     def __init__(self, lhs: str, separator: str, rhs: str, min_size: Optional[int] = None) -> None:
-        super().__init__(token_length(lhs) + token_length(rhs) + token_length(separator))
+        encoder = _get_encoder()
+        self._tokens_lhs = encoder.encode_ordinary(lhs)
+        self._tokens_rhs = encoder.encode_ordinary(rhs)
+        self._tokens_separator = list(_encode(separator))
+        super().__init__(
+            len(self._tokens_lhs) + len(self._tokens_rhs) + len(self._tokens_separator)
+        )
         self.string1 = lhs
         self.string2 = rhs
         self.separator = separator
-        self.min_size_ = min_size if min_size else token_length(self.separator)
+        self.min_size_ = min_size if min_size else len(self._tokens_separator)
+        self._string: Optional[str] = None
 
     def fit(self, max_size: int) -> Optional[Tuple[str, int]]:
+        if self.min_size <= max_size and self.size <= max_size:
+            # everything fits, so there is nothing to cut and decode
+            return str(self), self.size
+        return super().fit(max_size)
+
+    def fit_tokens(self, max_size: int) -> Optional[Tuple[List[int], int]]:
         if self.min_size <= max_size:
-            separator_size = token_length(self.separator)
+            separator_size = len(self._tokens_separator)
             remaining_size = max_size - separator_size
-            tokens_lhs = ENCODER.encode(self.string1)
-            tokens_rhs = ENCODER.encode(self.string2)
+            tokens_lhs = self._tokens_lhs
+            tokens_rhs = self._tokens_rhs
             size_lhs = remaining_size // 2
             size_lhs = max(size_lhs, remaining_size - len(tokens_rhs))
-            # cut tokens_lhs to the rightmost size_lhs tokens
-            tokens_lhs = tokens_lhs[-size_lhs:] if size_lhs > 0 else []
-            size_rhs = remaining_size - len(tokens_lhs)
-            # cut tokens_rhs to the leftmost size_rhs tokens
-            tokens_rhs = tokens_rhs[:size_rhs] if size_rhs > 0 else []
-            combined_string = (
-                ENCODER.decode(tokens_lhs) + self.separator + ENCODER.decode(tokens_rhs)
-            )
-            return combined_string, len(tokens_lhs) + separator_size + len(tokens_rhs)
+            size_lhs = max(0, min(size_lhs, len(tokens_lhs)))
+            size_rhs = max(0, min(remaining_size - size_lhs, len(tokens_rhs)))
+            # build the result in a single list: the rightmost size_lhs tokens of tokens_lhs,
+            # the separator, then the leftmost size_rhs tokens of tokens_rhs
+            combined_tokens = tokens_lhs[len(tokens_lhs) - size_lhs :]
+            combined_tokens += self._tokens_separator
+            combined_tokens += tokens_rhs[:size_rhs]
+            return combined_tokens, len(combined_tokens)
         return None
 
     @property
@@ -86,56 +145,142 @@ class SplitStringPrompt(Prompt):
         return self.min_size_
 
     def __str__(self) -> str:
-        return self.string1 + self.separator + self.string2
+        if self._string is None:
+            self._string = self.string1 + self.separator + self.string2
+        return self._string
 
 
 class ConcatPrompt(Prompt):
+    __slots__ = (
+        "prompt1",
+        "prompt2",
+        "_children",
+        "_min_size",
+        "_min_size_rest",
+        "_string",
+        "_fused",
+    )
+
     def __init__(self, prompt1: Prompt, prompt2: Prompt) -> None:
         super().__init__(prompt1.size + prompt2.size)
         self.prompt1 = prompt1
         self.prompt2 = prompt2
+        # flattened lazily by `children`, so building a chain `a + b + c + ...` stays linear
+        self._children: Optional[List[Prompt]] = None
+        self._min_size_rest: Optional[List[int]] = None
+        self._min_size = prompt1.min_size + prompt2.min_size
+        self._string: Optional[str] = None
+        # a concatenation of plain strings either fits whole or not at all
+        self._fused = all(
+            isinstance(prompt, StringPrompt)
+            or (isinstance(prompt, ConcatPrompt) and prompt._fused)
+            for prompt in (prompt1, prompt2)
+        )
 
-    def fit(self, max_size: int) -> Optional[Tuple[str, int]]:
-        max_size1 = max_size - self.prompt2.min_size
-        first = self.prompt1.fit(max_size1)
-        if first is None:
-            return None
+    @property
+    def children(self) -> List[Prompt]:
+        """
+        The leaves of this concatenation, from left to right.
+        Nested concatenations are flattened so that fitting is a single loop over the leaves;
+        this gives the same result as recursing because each operand is only ever given the
+        budget left over after the minimum sizes of everything to its right.
+        """
+        if self._children is None:
+            children: List[Prompt] = []
+            # walked with an explicit stack, since a long chain would exceed the recursion limit
+            stack: List[Prompt] = [self.prompt2, self.prompt1]
+            while stack:
+                prompt = stack.pop()
+                if isinstance(prompt, ConcatPrompt):
+                    if prompt._children is not None:
+                        children.extend(prompt._children)
+                    else:
+                        stack.append(prompt.prompt2)
+                        stack.append(prompt.prompt1)
+                else:
+                    children.append(prompt)
+            self._children = children
+        return self._children
+
+    def _rest_sizes(self) -> List[int]:
+        """`_rest_sizes()[i]` is the room that has to be left for the children after child i."""
+        if self._min_size_rest is None:
+            min_sizes = [child.min_size for child in self.children]
+            self._min_size_rest = list(accumulate(reversed(min_sizes[1:]), initial=0))[::-1]
+        return self._min_size_rest
 
-        string1, size1 = first
-        remaining_size = max_size - size1
-        second = self.prompt2.fit(remaining_size)
-        if second is None:
+    def fit(self, max_size: int) -> Optional[Tuple[str, int]]:
+        if self._fused:
+            if self.size <= max_size:
+                return str(self), self.size
             return None
-
-        string2, size2 = second
-        return string1 + string2, size1 + size2
+        return super().fit(max_size)
+
+    def fit_tokens(self, max_size: int) -> Optional[Tuple[List[int], int]]:
+        tokens: List[int] = []
+        remaining_size = max_size
+        for child, min_size_rest in zip(self.children, self._rest_sizes()):
+            fitted = child.fit_tokens(remaining_size - min_size_rest)
+            if fitted is None:
+                return None
+            child_tokens, child_size = fitted
+            tokens += child_tokens
+            remaining_size -= child_size
+        return tokens, max_size - remaining_size
 
     @property
     def min_size(self) -> int:
-        return self.prompt1.min_size + self.prompt2.min_size
+        return self._min_size
 
     def __str__(self) -> str:
-        return str(self.prompt1) + str(self.prompt2)
+        if self._string is None:
+            self._string = "".join(map(str, self.children))
+        return self._string
 
 
 class EitherPrompt(Prompt):
+    __slots__ = ("prompt1", "prompt2", "_min_size", "_fit_cache", "_fit_tokens_cache")
+
     def __init__(self, prompt1: Prompt, prompt2: Prompt) -> None:
         super().__init__(max(prompt1.size, prompt2.size))
         self.prompt1 = prompt1
         self.prompt2 = prompt2
+        self._min_size = min(prompt1.min_size, prompt2.min_size)
+        # the last (max_size, result) pair; enclosing prompts often ask again for the same size
+        self._fit_cache: Tuple[int, Optional[Tuple[str, int]]] = (-1, None)
+        self._fit_tokens_cache: Tuple[int, Optional[Tuple[List[int], int]]] = (-1, None)
 
     def fit(self, max_size: int) -> Optional[Tuple[str, int]]:
-        first = self.prompt1.fit(max_size)
-        if first is not None:
-            return first
-        return self.prompt2.fit(max_size)
+        cached_size, cached = self._fit_cache
+        if cached_size == max_size:
+            return cached
+        fitted = self.prompt1.fit(max_size)
+        if fitted is None:
+            fitted = self.prompt2.fit(max_size)
+        self._fit_cache = (max_size, fitted)
+        return fitted
+
+    def fit_tokens(self, max_size: int) -> Optional[Tuple[List[int], int]]:
+        cached_size, cached = self._fit_tokens_cache
+        if cached_size == max_size:
+            return cached
+        fitted = self.prompt1.fit_tokens(max_size)
+        if fitted is None:
+            fitted = self.prompt2.fit_tokens(max_size)
+        self._fit_tokens_cache = (max_size, fitted)
+        return fitted
 
     @property
     def min_size(self) -> int:
-        return min(self.prompt1.min_size, self.prompt2.min_size)
+        return self._min_size
 
     def __str__(self) -> str:
-        return "(" + str(self.prompt1) + " | " + str(self.prompt2) + ")"
+        return "".join(("(", str(self.prompt1), " | ", str(self.prompt2), ")"))
+
+
+def _precompute_token_lens(elements: List[str]) -> List[int]:
+    encoded = _get_encoder().encode_ordinary_batch(elements, num_threads=os.cpu_count() or 1)
+    return [len(tokens) for tokens in encoded]
 
 
 def generate_list_prompts(
@@ -143,7 +288,8 @@ def generate_list_prompts(
 ) -> List[Prompt]:
     """
     Generates a list of prompts using a given prompt function, a list of elements, and a maximum size.
-    Split up the list into smaller lists until the prompt fits into the maximum size.
+    Split up the list into consecutive runs of elements, each as long as possible while its prompt
+    still fits into the maximum size.
 
     Args:
         prompt_func (Callable[[List[str]], Prompt]): The prompt function used to create prompts.
@@ -153,19 +299,33 @@ def generate_list_prompts(
     Returns:
         List[Prompt]: The list of generated prompts.
     """
+    if not elements:
+        return [prompt_func(elements)]
+    sizes = _precompute_token_lens(elements)
+    # The elements of elements[i:j] on their own take sum(sizes[i:j]) tokens, less at most one
+    # token merged across each boundary when they are joined, so (empty elements aside)
+    #     bounds[j] - bounds[i] + 1
+    # is a lower bound on the size of prompt_func(elements[i:j]).
+    bounds = list(accumulate((max(size - 1, 0) for size in sizes), initial=0))
     prompts = []
-    prompt = prompt_func(elements)
-    if prompt.fit(max_size) is not None:
-        return [prompt]
-    else:
-        middle = len(elements) // 2
-        left_elements = elements[:middle]
-        right_elements = elements[middle:]
-        left_prompts = generate_list_prompts(prompt_func, left_elements, max_size)
-        right_prompts = generate_list_prompts(prompt_func, right_elements, max_size)
-        prompts.extend(left_prompts)
-        prompts.extend(right_prompts)
-        return prompts
+    start = 0
+    while start < len(elements):
+        # greedily take the longest run of elements that fits, searching only up to the bound
+        hi = max(bisect_right(bounds, bounds[start] + max_size - 1) - 1, start + 1)
+        lo = start + 1
+        # an element too large to fit on its own still gets a prompt of its own
+        end, best = start + 1, None
+        while lo <= hi:
+            mid = (lo + hi) // 2
+            prompt = prompt_func(elements[start:mid])
+            if prompt.fit(max_size) is not None:
+                end, best = mid, prompt
+                lo = mid + 1
+            else:
+                hi = mid - 1
+        prompts.append(best if best is not None else prompt_func(elements[start:end]))
+        start = end
+    return prompts
 
 
 # every message follows <im_start>{role/name}\n{content}<im_end>\n
@@ -173,46 +333,77 @@ def generate_list_prompts(
 EXTRA_TOKENS_PER_MESSAGE = 6
 
 
-@dataclass
 class PromptMessage:
-    role: MessageRole
-    prompt: Prompt
+    __slots__ = ("role", "prompt", "size", "min_size")
 
-    @property
-    def min_size(self) -> int:
-        return self.prompt.min_size + EXTRA_TOKENS_PER_MESSAGE
+    def __init__(self, role: MessageRole, prompt: Prompt) -> None:
+        self.role = role
+        self.prompt = prompt
+        self.size = prompt.size + EXTRA_TOKENS_PER_MESSAGE
+        self.min_size = prompt.min_size + EXTRA_TOKENS_PER_MESSAGE
 
-    @property
-    def size(self) -> int:
-        return self.prompt.size + EXTRA_TOKENS_PER_MESSAGE
+    def __eq__(self, other) -> bool:
+        if not isinstance(other, PromptMessage):
+            return NotImplemented
+        return self.role == other.role and self.prompt == other.prompt
+
+    def __repr__(self) -> str:
+        return f"PromptMessage(role={self.role!r}, prompt={self.prompt!r})"
 
 
 # Class PromptMessages represents a collection of PromptMessage objects and provides a method to fit them into a given maximum size.
 class PromptMessages:
-    def __init__(self, messages: List[PromptMessage] = []) -> None:
-        self.messages = messages
+    def __init__(self, messages: Optional[List[PromptMessage]] = None) -> None:
+        self.messages = [] if messages is None else list(messages)
+        # the compiled `fit` and the number of messages it was compiled for
+        self._compiled: Optional[Tuple[int, Callable[[int], List[Message]]]] = None
 
     def add_prompt_message(self, role: MessageRole, prompt: Prompt) -> None:
         new_message = PromptMessage(role, prompt)
         self.messages.append(new_message)
 
+    def compile(self) -> Callable[[int], List[Message]]:
+        """
+        Returns the function behind `fit`, specialised to the current messages.
+        The per-message sizes and bound `fit` methods are computed once, which pays off when
+        fitting the same messages against many different sizes. The result is cached until
+        messages are added; `messages` may be appended to, but not modified in place.
+        """
+        compiled = self._compiled
+        if compiled is not None and compiled[0] == len(self.messages):
+            return compiled[1]
+        min_sizes = [message.min_size for message in self.messages]
+        # min_sizes_rest[i] is the room that has to be left for the messages after message i
+        min_sizes_rest = list(accumulate(reversed(min_sizes[1:]), initial=0))[::-1]
+        plan = [
+            (message.role, message.prompt.fit, message_min_size, min_size_rest)
+            for message, message_min_size, min_size_rest in zip(
+                self.messages, min_sizes, min_sizes_rest
+            )
+        ]
+
+        extra = EXTRA_TOKENS_PER_MESSAGE
+        mk = Message.mk
+
+        def fit(max_size: int) -> List[Message]:
+            fitted_messages: List[Message] = []
+            for role, prompt_fit, message_min_size, min_size_rest in plan:
+                if message_min_size > max_size:
+                    return fitted_messages
+                message_max_size = max(message_min_size, max_size - min_size_rest)
+                fitted_prompt = prompt_fit(message_max_size - extra)
+                if fitted_prompt is None:
+                    return fitted_messages
+                fitted_string, fitted_size = fitted_prompt
+                fitted_messages.append(mk(role, fitted_string))
+                max_size -= fitted_size + extra
+            return fitted_messages
+
+        self._compiled = (len(self.messages), fit)
+        return fit
+
     def fit(self, max_size: int) -> Optional[List[Message]]:
-        min_size = sum(message.min_size for message in self.messages)
-        fitted_messages: List[Message] = []
-        for message in self.messages:
-            message_max_size = message.min_size
-            if message_max_size > max_size:
-                return fitted_messages
-            min_size_rest = min_size - message.min_size
-            message_max_size = max(message_max_size, max_size - min_size_rest)
-            fitted_prompt = message.prompt.fit(message_max_size - EXTRA_TOKENS_PER_MESSAGE)
-            if fitted_prompt is None:
-                return fitted_messages
-            fitted_string, fitted_size = fitted_prompt
-            fitted_messages.append(Message.mk(message.role, fitted_string))
-            max_size -= fitted_size + EXTRA_TOKENS_PER_MESSAGE
-            min_size = min_size_rest
-        return fitted_messages
+        return self.compile()(max_size)
 
     def __str__(self) -> str:
         return "\n".join(str(message) for message in self.messages)
@@ -245,6 +436,22 @@ class Tests(TestCase):
         self.assertEqual(prompt.fit(11), ("Text Before The<cursor>This is after.", 10))
         self.assertEqual(str(prompt), "Text Before The<cursor>This is after.")
 
+    def test_split_string_prompt_long(self):
+        encoder = _get_encoder()
+        lines = [f"def f{i}(x):\n    return x * {i}  # line {i}\n" for i in range(300)]
+        lhs = "".join(lines[:200])
+        rhs = "\n\n  " + "".join(lines[200:])
+        prompt = SplitStringPrompt(lhs=lhs, rhs=rhs, separator="<cursor>")
+        for max_size in [3, 10, 57, 200, 1000, prompt.size]:
+            remaining_size = max_size - 3
+            expected_rhs = encoder.encode(rhs)
+            size_lhs = max(remaining_size // 2, remaining_size - len(expected_rhs))
+            expected_lhs = encoder.encode(lhs)[-size_lhs:] if size_lhs > 0 else []
+            expected_rhs = expected_rhs[: remaining_size - len(expected_lhs)]
+            expected = encoder.decode(expected_lhs) + "<cursor>" + encoder.decode(expected_rhs)
+            expected_size = len(expected_lhs) + 3 + len(expected_rhs)
+            self.assertEqual(prompt.fit(max_size), (expected, expected_size))
+
     def test_concat_prompt(self):
         prompt1 = StringPrompt("Hello")
         prompt2 = SplitStringPrompt(lhs="", rhs=", World!", separator="", min_size=0)
@@ -263,6 +470,20 @@ class Tests(TestCase):
         self.assertEqual(concat_prompt.min_size, 2)
         self.assertEqual(concat_prompt.size, 4)
 
+    def test_concat_string_prompts(self):
+        prompt = StringPrompt("Hello") + StringPrompt(", ") + StringPrompt("World!")
+        self.assertEqual(prompt.fit(prompt.size), ("Hello, World!", prompt.size))
+        self.assertEqual(prompt.fit(prompt.size - 1), None)
+        self.assertEqual(prompt.fit_tokens(prompt.size)[1], prompt.size)
+
+    def test_long_concat_chain(self):
+        words = [f"word{i} " for i in range(5000)]
+        prompt = StringPrompt(words[0])
+        for word in words[1:]:
+            prompt = prompt + StringPrompt(word)
+        self.assertEqual(prompt.fit(prompt.size), ("".join(words), prompt.size))
+        self.assertEqual(len(prompt.children), len(words))
+
     def test_concat_prompt2(self):
         prompt1 = StringPrompt("Make some comments on the following program:\n")
         prompt2 = SplitStringPrompt(
@@ -309,8 +530,8 @@ class Tests(TestCase):
 
         assert len(prompts) == 3  # The list should be split into 3 prompts
         assert (v := prompts[0].fit(max_size)) and v[0] == "Element 1, Element 2"
-        assert (v := prompts[1].fit(max_size)) and v[0] == "Element 3"
-        assert (v := prompts[2].fit(max_size)) and v[0] == "Element 4, Element 5"
+        assert (v := prompts[1].fit(max_size)) and v[0] == "Element 3, Element 4"
+        assert (v := prompts[2].fit(max_size)) and v[0] == "Element 5"
 
     def test_prompt_messages(self):
         prompt1 = StringPrompt("Hello")
@@ -337,3 +558,7 @@ class Tests(TestCase):
         self.assertNotEqual(fit3, fit2)
         fit4 = prompt_messages.fit(prompt_message1.size + prompt_message2.size + 1)
         self.assertEqual(fit4, fit2)
+
+        compiled = prompt_messages.compile()
+        for max_size in range(prompt_message1.size + prompt_message2.size + 2):
+            self.assertEqual(compiled(max_size), prompt_messages.fit(max_size))
@@ -64,8 +64,35 @@ def cumsum(iterable):
         yield total
 
 
+def splice_line_offsets(
+    offsets: list[int], start: int, end: int, new_text: str, text: str
+) -> list[int]:
+    """Given the `line_offsets` of a document, returns the `line_offsets` of the document `text`
+    obtained by replacing the `start:end` slice of the old text with `new_text`.
+
+    Only the lines around the edit are re-split; the offsets of later lines are shifted.
+    A line either side of the edit is included so that line breaks that
+    join or split across the boundary (eg `\\r` + `\\n`) are handled the same way as `str.splitlines`.
+    """
+    if len(text) == 0:
+        return [0]
+    if offsets == [0]:
+        # the old document was empty.
+        return list(cumsum(map(len, text.splitlines(keepends=True))))
+    delta = len(new_text) - (end - start)
+    i0 = max(bisect.bisect_right(offsets, start) - 1, 0)
+    a = offsets[i0 - 1] if i0 > 0 else 0
+    j1 = bisect.bisect_right(offsets, end) + 1
+    if j1 >= len(offsets):
+        j1 = len(offsets) - 1
+    b = offsets[j1] + delta
+    mid = [a + x for x in cumsum(map(len, text[a:b].splitlines(keepends=True)))]
+    return offsets[:i0] + mid + [x + delta for x in offsets[j1 + 1 :]]
+
+
 @dataclass
 class Position:
+    __slots__ = ("line", "character")
     line: int
     character: int
 
@@ -107,6 +134,7 @@ class Position:
 
 @dataclass
 class Range:
+    __slots__ = ("start", "end")
     start: Position
     end: Position
 
@@ -333,6 +361,29 @@ class DocumentContext:
             self.position_to_offset(range.end),
         )
 
+    def apply_changes(
+        self, changes: Iterable[TextDocumentContentChangeEvent], **kwargs
+    ) -> "DocumentContext":
+        """Returns a copy of the document with the changes applied in order, with any other fields replaced by `kwargs`.
+
+        Rather than recomputing `line_offsets` from the whole text after every change,
+        they are patched around each edit, so a keystroke costs roughly the size of the lines it touches.
+        """
+        doc = self
+        for change in changes:
+            if change.range is None:
+                doc = DocumentContext(change.text)
+                continue
+            start, end = doc.range_to_offsets(change.range)
+            text = doc.text[:start] + change.text + doc.text[end:]
+            offsets = splice_line_offsets(doc.line_offsets, start, end, change.text, text)
+            doc = DocumentContext(text)
+            doc.__dict__["line_offsets"] = offsets
+        result = replace(self, text=doc.text, **kwargs)
+        if "line_offsets" in doc.__dict__:
+            result.__dict__["line_offsets"] = doc.line_offsets
+        return result
+
     # [todo] enter, exit does setdoc
 
 
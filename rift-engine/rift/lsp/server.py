@@ -5,7 +5,7 @@ This file is adapted from  https://github.com/EdAyers/sss
 import asyncio
 import logging
 from collections import defaultdict
-from dataclasses import dataclass, replace
+from dataclasses import dataclass
 from typing import Any, Awaitable, Callable, Optional, Union
 
 import rift.lsp.types as lsp
@@ -42,6 +42,7 @@ class LspServer(ExtraRpc):
         self.capabilities = ServerCapabilities()
         self.documents = dict()
         self.fts = dict()
+        self._document_waiters: dict[lsp.DocumentUri, asyncio.Future] = {}
         super().__init__(transport, init_mode=InitializationMode.ExpectInit)
 
     @rpc_method("initialize")
@@ -117,10 +118,36 @@ class LspServer(ExtraRpc):
     @rpc_method("textDocument/didOpen")
     def on_did_open(self, params: lsp.DidOpenTextDocumentParams):
         item = params.textDocument
-        logger.debug(f"editor opened {item.uri}")
+        logger.debug("editor opened %s", item.uri)
         self.documents[item.uri] = item
+        waiter = self._document_waiters.pop(item.uri, None)
+        if waiter is not None and not waiter.done():
+            waiter.set_result(None)
         # return {"status": "ok"}
 
+    async def get_document(
+        self, uri: lsp.DocumentUri, timeout: float = 3.0
+    ) -> lsp.TextDocumentItem:
+        """Returns the open document for `uri`.
+
+        A request naming a document can arrive before the editor's didOpen for it, so this waits
+        up to `timeout` seconds for the document to be opened before raising `LookupError`."""
+        document = self.documents.get(uri)
+        if document is not None:
+            return document
+        waiter = self._document_waiters.get(uri)
+        if waiter is None:
+            waiter = asyncio.get_running_loop().create_future()
+            self._document_waiters[uri] = waiter
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter), timeout)
+        except asyncio.TimeoutError:
+            # don't keep a waiter around for a document that may never be opened.
+            if self._document_waiters.get(uri) is waiter and not waiter.done():
+                del self._document_waiters[uri]
+            raise LookupError(f"document {uri} not opened") from None
+        return self.documents[uri]
+
     @rpc_method("textDocument/didChange")
     async def _on_did_change(self, params: lsp.DidChangeTextDocumentParams):
         item_id = params.textDocument
@@ -128,10 +155,7 @@ class LspServer(ExtraRpc):
         if document is None:
             logger.error(f"document {item_id.uri} not opened")
             return
-        text = document.text
-        for change in params.contentChanges:
-            text = change.apply(text)
-        document_after = replace(document, version=item_id.version, text=text)
+        document_after = document.apply_changes(params.contentChanges, version=item_id.version)
         self.documents[item_id.uri] = document_after
 
         kwargs: Any = dict(before=document, after=document_after, changes=params)
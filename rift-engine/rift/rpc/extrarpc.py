@@ -127,7 +127,7 @@ class ExtraRpc(RpcServer):
             params.workDoneToken = token
         assert token is not None
         if token in self._my_progress:
-            logger.debug(f"multiple requests with same progress token: {token}")
+            logger.debug("multiple requests with same progress token: %s", token)
             # note that this is ok, sometimes lots of requests get the same progress updates.
             # eg lots of requests might all depend on the same upstream task, and the progress bar is the same for all of them.
         fut = asyncio.create_task(self.request(method, params))
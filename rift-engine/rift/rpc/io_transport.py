@@ -76,9 +76,23 @@ class AsyncStreamTransport(Transport):
             raise TransportClosedError("unexpected end of stream") from e
 
     async def send(self, data: bytes, header={}):
-        header["Content-Length"] = len(data)
-        header = "".join(f"{k}:{v}\r\n" for k, v in header.items())
-        header += "\r\n"
-        self.writer.write(header.encode())
-        self.writer.write(data)
+        if header:
+            header = {**header, "Content-Length": len(data)}
+            head = ("".join(f"{k}:{v}\r\n" for k, v in header.items()) + "\r\n").encode()
+        else:
+            head = b"Content-Length:%d\r\n\r\n" % len(data)
+        # the header and body go out in a single write so they aren't sent as separate segments.
+        if len(data) < 8192:
+            self.writer.write(head + data)
+        else:
+            self.writer.writelines((head, data))
+        await self.writer.drain()
+
+    async def send_many(self, datas):
+        """Frames all of the messages and writes them to the stream in one go."""
+        chunks = []
+        for data in datas:
+            chunks.append(b"Content-Length:%d\r\n\r\n" % len(data))
+            chunks.append(data)
+        self.writer.write(b"".join(chunks))
         await self.writer.drain()
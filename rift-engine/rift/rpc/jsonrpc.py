@@ -8,16 +8,23 @@ import json
 import logging
 import sys
 import warnings
+import weakref
 from asyncio import Future, Task
+from contextvars import ContextVar
 from dataclasses import MISSING, asdict, dataclass, field, is_dataclass
 from enum import Enum
 from functools import partial, singledispatch
-from typing import Any, Optional, Union
+from typing import Any, ClassVar, Optional, Union
 
-from rift.util.ofdict import MyJsonEncoder, ofdict, todict, todict_dataclass
+from rift.util.ofdict import MyJsonEncoder, ofdict, todict
 
 from .transport import Transport, TransportClosedError, TransportClosedOK, TransportError
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
 logger = logging.getLogger(__name__)
 
 
@@ -70,6 +77,40 @@ class ErrorCode(Enum):
 
 encoder = MyJsonEncoder()
 
+if orjson is not None:
+    # dataclasses and datetimes are passed through to `todict` so that they are encoded the
+    # same way as with MyJsonEncoder (eg optional fields that are None are dropped).
+    _ORJSON_OPTIONS = (
+        orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATACLASS | orjson.OPT_PASSTHROUGH_DATETIME
+    )
+
+
+def _dumps(obj: Any) -> bytes:
+    """Encode the given object as JSON bytes, converting Python objects with `todict`.
+
+    Uses orjson if it is installed, falling back to MyJsonEncoder for anything orjson can't encode.
+    """
+    if orjson is not None:
+        try:
+            return orjson.dumps(obj, default=todict, option=_ORJSON_OPTIONS)
+        except TypeError:
+            pass
+    return encoder.encode(obj).encode()
+
+
+def _loads(data: Union[bytes, str]) -> Any:
+    """Decode JSON, using orjson if it is installed.
+
+    Falls back to `json.loads` for inputs orjson rejects but the json module accepts (eg NaN, big ints).
+    Either way, invalid JSON raises a `json.JSONDecodeError`.
+    """
+    if orjson is not None:
+        try:
+            return orjson.loads(data)
+        except orjson.JSONDecodeError:
+            pass
+    return json.loads(data)
+
 
 @dataclass
 class Request:
@@ -90,9 +131,18 @@ class Request:
         """True if this is a notification request. Notifications do not have an id and so can't be responded to."""
         return self.id is None
 
+    def __todict__(self):
+        # built directly rather than reflecting over the fields with todict_dataclass.
+        d: dict[str, Any] = {"method": self.method}
+        if self.id is not None:
+            d["id"] = self.id
+        if self.params is not None:
+            d["params"] = self.params
+        return d
+
     def to_bytes(self):
-        """Encode the request as bytes. Note that this will automatically convert Python objects to JSON using MyJsonEncoder."""
-        return encoder.encode(self).encode()
+        """Encode the request as bytes. Note that this will automatically convert Python objects to JSON using `todict`."""
+        return _dumps(self)
 
     def __str__(self):
         if self.id is None:
@@ -114,6 +164,12 @@ class ResponseError(Exception):
     message: str
     data: Optional[Any] = field(default=None)
 
+    def __todict__(self):
+        d = {"code": self.code.value, "message": self.message}
+        if self.data is not None:
+            d["data"] = self.data
+        return d
+
     def __str__(self):
         return f"{self.code.name}: {self.message}"
 
@@ -166,13 +222,33 @@ class Response:
     jsonrpc: str = field(default="2.0")
 
     def __todict__(self):
-        d = todict_dataclass(self)
-        if "error" not in d and "result" not in d:
-            d["result"] = None
-        return d
+        # Almost all responses are successes, so build the dict directly rather than with todict_dataclass.
+        if self.error is None:
+            return {"jsonrpc": self.jsonrpc, "id": self.id, "result": self.result}
+        return {"jsonrpc": self.jsonrpc, "id": self.id, "error": todict(self.error)}
 
     def to_bytes(self):
-        return encoder.encode(self).encode()
+        return _dumps(self)
+
+
+_NULL_RESULT_TEMPLATE = b'{"jsonrpc":"2.0","id":%s,"result":null}'
+_ERROR_RESPONSE_TEMPLATE = b'{"jsonrpc":"2.0","id":%s,"error":{"code":%d,"message":%s}}'
+_ERROR_RESPONSE_DATA_TEMPLATE = (
+    b'{"jsonrpc":"2.0","id":%s,"error":{"code":%d,"message":%s,"data":%s}}'
+)
+
+
+def _error_response_bytes(
+    id: Optional[Union[str, int]], code: ErrorCode, message: str, data: Optional[Any] = None
+) -> bytes:
+    """Encode an error response.
+
+    Equivalent to `Response(id=id, error=ResponseError(code, message, data)).to_bytes()`, but error
+    responses have a fixed shape so only the fields need encoding.
+    """
+    if data is None:
+        return _ERROR_RESPONSE_TEMPLATE % (_dumps(id), code.value, _dumps(message))
+    return _ERROR_RESPONSE_DATA_TEMPLATE % (_dumps(id), code.value, _dumps(message), _dumps(data))
 
 
 class Dispatcher:
@@ -188,15 +264,32 @@ class Dispatcher:
     def __init__(self, methods=None, extra_kwargs={}):
         self.methods = methods or {}
         self.extra_kwargs = extra_kwargs
+        # inspect.signature is slow, so the param/return types of each method are resolved once
+        # when the method is registered rather than on every request.
+        self._param_types: dict[str, Any] = {}
+        self._return_types: dict[str, Any] = {}
+        self._is_async: dict[str, bool] = {}
+        self._blocking: dict[str, bool] = {}
+        # callables with extra_kwargs already applied, built lazily so `dispatch` doesn't
+        # allocate a new partial per request.
+        self._bound: dict[str, Any] = {}
+        for funcname, fn in self.methods.items():
+            self._inspect_method(funcname, fn)
 
     def __contains__(self, method):
         return method in self.methods
 
     def __getitem__(self, method):
-        return partial(self.methods[method], **self.extra_kwargs)
+        try:
+            return self._bound[method]
+        except KeyError:
+            fn = self.methods[method]
+            if self.extra_kwargs:
+                fn = partial(fn, **self.extra_kwargs)
+            self._bound[method] = fn
+            return fn
 
-    def param_type(self, method):
-        fn = self.methods[method]
+    def _inspect_method(self, funcname, fn):
         sig = inspect.signature(fn)
         if len(sig.parameters) == 0:
             T = Any
@@ -205,16 +298,22 @@ class Dispatcher:
             T = P.annotation
             if T is inspect.Parameter.empty:
                 T = Any
-        return T
+        self._param_types[funcname] = T
+        a = sig.return_annotation
+        self._return_types[funcname] = Any if a is inspect.Signature.empty else a
+        blocking = getattr(fn, "rpc_blocking", False) and not asyncio.iscoroutinefunction(fn)
+        self._blocking[funcname] = blocking
+        self._is_async[funcname] = blocking or asyncio.iscoroutinefunction(fn)
+
+    def param_type(self, method):
+        return self._param_types[method]
 
     def return_type(self, method):
-        fn = self.methods[method]
-        sig = inspect.signature(fn)
-        a = sig.return_annotation
-        if a is inspect.Signature.empty:
-            return Any
-        else:
-            return a
+        return self._return_types[method]
+
+    def is_async(self, method):
+        """True if handling the method suspends, ie the handler is a coroutine function or is run in an executor."""
+        return self._is_async[method]
 
     def register(self, name=None):
         def core(fn):
@@ -222,6 +321,8 @@ class Dispatcher:
             if funcname in self.methods:
                 warnings.warn(f"method with name {funcname} already registered, overwriting")
             self.methods[funcname] = fn
+            self._bound.pop(funcname, None)
+            self._inspect_method(funcname, fn)
             return fn
 
         return core
@@ -231,12 +332,28 @@ class Dispatcher:
 
     async def dispatch(self, method: str, params: Any):
         fn = self[method]
+        if self._blocking[method]:
+            return await asyncio.get_running_loop().run_in_executor(None, fn, params)
         result = fn(params)
         if asyncio.iscoroutine(result):
             result = await result
         return result
 
 
+# Method names that the server treats specially. Incoming method names are interned too, so
+# comparisons against these (and dispatcher lookups) usually succeed on the identity check.
+_EXIT = sys.intern("exit")
+_SHUTDOWN = sys.intern("shutdown")
+_INITIALIZE = sys.intern("initialize")
+_CANCEL_REQUEST = sys.intern("$/cancelRequest")
+
+_response_batch: ContextVar[Optional[list[bytes]]] = ContextVar("_response_batch", default=None)
+""" Set while handling the requests of an incoming batch; their responses are collected here
+and sent back to the peer as a single batch response. """
+
+_EAGER_START = sys.version_info >= (3, 12)
+""" Whether asyncio.Task supports `eager_start`. """
+
 server_count = 0
 """Counter for labelling servers with a unique id."""
 
@@ -265,7 +382,7 @@ class ExitNotification(Exception):
     """Thrown when the server recieved an exit notifaction from its peer."""
 
 
-def rpc_method(name: Optional[str] = None):
+def rpc_method(name: Optional[str] = None, *, blocking: bool = False):
     """Decorate your method with this to say that you are implementing a JSON-RPC method.
 
     Example:
@@ -278,12 +395,17 @@ def rpc_method(name: Optional[str] = None):
 
     Methods should have a single argument.
     Methods can be async.
+    Plain methods are run directly on the event loop, so pass `blocking=True` for one that does slow
+    synchronous work (eg reading files); it will be run in the loop's default executor instead.
+    Such a method runs on another thread, so it shouldn't mutate state shared with the event loop.
     If the method's argument is annotated with type T, then the argument will be converted from JSON to T using `fromdict(T, ·)`.
     Most builtin types are supported, as well as dataclasses and pydantic models.
     """
 
     def decorator(fn):
         setattr(fn, "rpc_method", name or fn.__name__)
+        if blocking:
+            setattr(fn, "rpc_blocking", True)
         return fn
 
     return decorator
@@ -380,12 +502,23 @@ class RpcServer:
     """ This is a human-readable name that will be used in log messages."""
     request_counter: int
     """ Unique id for each request I make to my peer. """
-    my_requests: dict[RequestId, Future[Any]]
-    """ Requests that I have made to my peer. """
+    my_requests: "weakref.WeakValueDictionary[int, Future[Any]]"
+    """ Requests that I have made to my peer.
+    Keyed by ids minted from `request_counter`, so they are always unique ints.
+    The futures are held weakly: if the caller drops a request, the peer is sent a cancel notification. """
     their_requests: dict[RequestId, Task]
     """ Requests that my peer has made to me. """
+    _cancelled_requests: set[int]
+    """ Ids of my requests that I sent a cancel notification for, whose responses can be ignored. """
     notification_tasks: set[asyncio.Task]
     """ Tasks running from notifications that my peer has sent to me. """
+    eager_request_tasks: ClassVar[bool] = True
+    """ If true, the tasks handling my peer's requests are started eagerly (Python 3.12+ only). """
+    _rpc_methods: ClassVar[dict[str, str]] = {}
+    """ Maps the attribute names of this class's `@rpc_method`s to their RPC method names. """
+    _send_queue: list[bytes]
+    """ Encoded messages waiting to be flushed to the transport. """
+    _flush_task: Optional[Task]
 
     def __init__(
         self,
@@ -412,23 +545,63 @@ class RpcServer:
             self.status = RpcServerStatus.preinit
         self.transport = transport
         self.dispatcher = dispatcher or Dispatcher()
-        self.my_requests = {}
+        self.my_requests = weakref.WeakValueDictionary()
         self.their_requests = {}
+        self._cancelled_requests = set()
         self.request_counter = 1000 * server_count
         self.notification_tasks = set()
-
-        for name, method in inspect.getmembers(self, predicate=inspect.ismethod):
-            rpc_method = getattr(method, "rpc_method", None)
-            if rpc_method is not None:
-                # [todo] assert that the signature is correct
-                logger.debug(f"registering RPC method '{rpc_method}' to {method.__qualname__}")
-                self.dispatcher.register(rpc_method)(method)
+        self._send_queue = []
+        self._flush_task = None
+
+        for name, rpc_method in type(self)._rpc_methods.items():
+            method = getattr(self, name)
+            if not inspect.ismethod(method):
+                continue
+            # [todo] assert that the signature is correct
+            logger.debug("registering RPC method '%s' to %s", rpc_method, method.__qualname__)
+            self.dispatcher.register(rpc_method)(method)
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        # Collect the `@rpc_method`s once per class, rather than scanning every member of each
+        # instance with inspect.getmembers in __init__.
+        methods = {}
+        for base in reversed(cls.__mro__):
+            for name, attr in vars(base).items():
+                rpc_method = getattr(attr, "rpc_method", None)
+                if rpc_method is not None:
+                    methods[name] = rpc_method
+                else:
+                    # overridden without the decorator.
+                    methods.pop(name, None)
+        cls._rpc_methods = dict(sorted(methods.items()))
 
     def __str__(self):
         return self.name
 
     async def _send(self, r: Union[Response, Request]):
-        await self.transport.send(r.to_bytes())
+        await self._send_bytes(r.to_bytes())
+
+    async def _send_error(self, id: Optional[RequestId], code: ErrorCode, message: str, data=None):
+        await self._send_bytes(_error_response_bytes(id, code, message, data))
+
+    async def _send_bytes(self, data: bytes):
+        # Messages sent during the same event loop tick are queued and written to the transport
+        # together by a single flush task, rather than paying for a write + drain per message.
+        self._send_queue.append(data)
+        if self._flush_task is None:
+            self._flush_task = asyncio.create_task(self._flush())
+        # shielded so that cancelling one sender doesn't drop the messages of the others.
+        await asyncio.shield(self._flush_task)
+
+    async def _flush(self):
+        try:
+            while self._send_queue:
+                queue = self._send_queue
+                self._send_queue = []
+                await self.transport.send_many(queue)
+        finally:
+            self._flush_task = None
 
     async def notify(self, method: str, params: Optional[Any]):
         """Send a notification to the peer."""
@@ -453,8 +626,11 @@ class RpcServer:
             - RuntimeError: if the server is not in the running state.
             - ResponseError: if the peer responds with an error, you can use ResponseError.code to determine the cause of the error.
 
+        If the awaiting task is cancelled (eg an agent waiting on user input is cancelled), a `$/cancelRequest`
+        notification is sent to the peer straight away. If the request is otherwise abandoned, the
+        notification is sent once the response future is garbage collected.
+
         Todo:
-           - Cancellation support: rather than a coro it should return a cancellable future.
            - timeout?
         """
         if self.status != RpcServerStatus.running:
@@ -466,15 +642,23 @@ class RpcServer:
         id = self.request_counter
         req = Request(method=method, id=id, params=params)
         # print("REQUEST: ", req)
-        fut = asyncio.get_running_loop().create_future()
-        # [todo] I think the pythonic way to do this is to have this dict be a weakref, and the
-        # caller is responsible for holding the request object.
-        # If the request future is disposed then we send a cancel request to client.
-        if id in self.my_requests:
-            raise RuntimeError(f"non-unique request id {id} found")
+        loop = asyncio.get_running_loop()
+        fut = loop.create_future()
+        # my_requests only holds fut weakly, the caller is responsible for holding the request.
+        # The finalizer is detached once the peer responds.
+        fut.rpc_finalizer = weakref.finalize(fut, self._on_my_request_gc, loop, id)  # type: ignore
+        # ids come from a monotonic counter so they can't collide.
+        assert id not in self.my_requests, f"non-unique request id {id} found"
         self.my_requests[id] = fut
         await self._send(req)
-        return await fut
+        try:
+            return await fut
+        except asyncio.CancelledError:
+            if not fut.done() or fut.cancelled():
+                fut.rpc_finalizer.detach()  # type: ignore
+                self.my_requests.pop(id, None)
+                self._send_cancel(id)
+            raise
 
     async def _send_init(self, init_param):
         """Send an initialization request to the peer."""
@@ -514,25 +698,10 @@ class RpcServer:
         try:
             while True:
                 try:
-                    data = await self.transport.recv()
-                    messages = json.loads(data)
-                    if isinstance(messages, dict):
-                        # datagram contains a single message
-                        messages = [messages]
-                    elif not isinstance(messages, list):
-                        raise TypeError(f"expected list or dict, got {type(messages)}")
-                    for message in messages:
-                        self._handle_message(message)
+                    await self._serve_one()
                 except TransportClosedOK as e:
                     logger.info(f"{self.name} transport closed gracefully: {e}")
                     return
-                except (json.JSONDecodeError, TypeError) as e:
-                    logger.exception("invalid json")
-                    response = Response(
-                        error=ResponseError(message=str(e), code=ErrorCode.parse_error)
-                    )
-                    await self._send(response)
-                    continue
                 except ExitNotification as e:
                     logger.info(f"{self.name} received exit notification")
                     return
@@ -556,10 +725,47 @@ class RpcServer:
             (_, e, _) = sys.exc_info()  # sys.exception() is 3.11 only
             if e is None:
                 e = ConnectionError(f"{self} shutdown")
-            for fut in self.my_requests.values():
-                fut.set_exception(e)
+            for fut in list(self.my_requests.values()):
+                fut.rpc_finalizer.detach()  # type: ignore
+                if not fut.done():
+                    fut.set_exception(e)
             self._shutdown()
 
+    async def _serve_one(self):
+        """Receives one datagram from the transport and handles the messages in it.
+
+        Only invalid messages are handled here, everything else propagates to `listen_forever`.
+        """
+        data = await self.transport.recv()
+        try:
+            messages = _loads(data)
+            if isinstance(messages, dict):
+                # datagram contains a single message
+                self._handle_message(messages)
+            elif isinstance(messages, list):
+                self._handle_batch(messages)
+            else:
+                raise TypeError(f"expected list or dict, got {type(messages)}")
+        except (json.JSONDecodeError, TypeError) as e:
+            logger.exception("invalid json")
+            await self._send_error(None, ErrorCode.parse_error, str(e))
+
+    def _on_my_request_gc(self, loop: asyncio.AbstractEventLoop, id: int):
+        """Called when the future for an unanswered request of mine is garbage collected."""
+        if self.status != RpcServerStatus.running or loop.is_closed():
+            return
+        # finalizers can run at any point (or thread) where a collection happens.
+        loop.call_soon_threadsafe(self._send_cancel, id)
+
+    def _send_cancel(self, id: int):
+        if self.status != RpcServerStatus.running:
+            return
+        # the peer still replies to a cancelled request.
+        self._cancelled_requests.add(id)
+        task = asyncio.create_task(self.notify("$/cancelRequest", {"id": id}))
+        self.notification_tasks.add(task)
+        task.add_done_callback(self.notification_tasks.discard)
+
     def _shutdown(self):
         # [todo] also send cancel notifications to all our pending request futures.
         for t in self.their_requests.values():
@@ -569,77 +775,185 @@ class RpcServer:
         self.status = RpcServerStatus.shutdown
         logger.info(f"{self} entered shutdown state")
 
-    def _handle_message(self, message: Any):
+    def _handle_batch(self, messages: list):
+        """Handles a JSON-RPC batch, replying to its requests with a single batch response."""
+        batch: list[bytes] = []
+        tasks = []
+        # the request tasks copy the current context when they are created, so their
+        # `_respond` calls will see the batch.
+        token = _response_batch.set(batch)
+        try:
+            for message in messages:
+                task = self._handle_message(message)
+                if task is not None:
+                    tasks.append(task)
+        finally:
+            _response_batch.reset(token)
+            if tasks:
+                task = asyncio.create_task(self._send_batch(tasks, batch))
+                self.notification_tasks.add(task)
+                task.add_done_callback(self.notification_tasks.discard)
+
+    async def _send_batch(self, tasks: list[Task], batch: list[bytes]):
+        await asyncio.wait(tasks)
+        if batch:
+            await self._send_bytes(b"[" + b",".join(batch) + b"]")
+
+    def _handle_message(self, message: Any) -> Optional[Task]:
+        """Handles an incoming message.
+
+        Returns the task handling the message if it is a request that needs a response."""
         # logger.info(f"incoming message {message=}")
         if "result" in message or "error" in message:
-            # message is a Response
-            res = ofdict(Response, message)
-            if res.id not in self.my_requests:
-                logger.error(f"received response for unknown request: {res}")
+            # message is a Response.
+            # The fields are read directly rather than with ofdict(Response, message), since this
+            # runs for every reply to our requests and result is Any anyway.
+            id = message.get("id")
+            fut = self.my_requests.pop(id, None)
+            if fut is None:
+                if id in self._cancelled_requests:
+                    self._cancelled_requests.discard(id)
+                else:
+                    logger.error(f"received response for unknown request: {message}")
                 return
-            fut = self.my_requests.pop(res.id)
+            fut.rpc_finalizer.detach()  # type: ignore
             if fut.done():
-                logger.error(f"received response for already completed request: {res} {fut}")
+                logger.error(f"received response for already completed request: {message} {fut}")
+                return
+            error = message.get("error")
+            if error is not None:
+                fut.set_exception(ofdict(ResponseError, error))
             else:
-                if res.error is not None:
-                    fut.set_exception(res.error)
-                else:
-                    fut.set_result(res.result)
+                fut.set_result(message.get("result"))
         else:
             # message is a Request.
-            req = ofdict(Request, message)
-            if req.method == "exit":
+            method = message.get("method")
+            if not isinstance(method, str):
+                raise TypeError(f"expected a string method in request, got {method!r}")
+            req = Request(
+                method=sys.intern(method), id=message.get("id"), params=message.get("params")
+            )
+            if req.method == _EXIT:
                 # exit notification should kill the server immediately.
                 if self.status != RpcServerStatus.shutdown:
                     logger.warning("exit notification received before shutdown request")
                 # https://microsoft.github.io/language-server-protocol/specifications/lsp/3.17/specification/#exit
                 raise ExitNotification()
-            if req.method == "shutdown":
+            if req.method == _SHUTDOWN:
                 self._shutdown()
-            task = asyncio.create_task(
-                self._on_request(req),
-                name=f"{self.name} handle {req}",
-            )
+            if req.is_notification and self._handle_notification_inline(req):
+                return
             id = req.id
+            if id is not None and id in self.their_requests:
+                raise invalid_request(f"request id {id} is already in use")
+            name = f"{self.name} handle {req}"
+            if _EAGER_START and self.eager_request_tasks:
+                # runs the handler up to its first suspension right away, saving a trip around
+                # the event loop before the handler starts.
+                task = asyncio.Task(
+                    self._on_request(req),
+                    loop=asyncio.get_running_loop(),
+                    name=name,
+                    eager_start=True,  # type: ignore
+                )
+            else:
+                task = asyncio.create_task(self._on_request(req), name=name)
             if id is not None:
                 # Request expects a reponse
-                if id in self.their_requests:
-                    raise invalid_request(f"request id {id} is already in use")
                 self.their_requests[id] = task
-                task.add_done_callback(lambda _: self.their_requests.pop(id))
+                # the id is stored on the task so that a single bound method can be used as the
+                # done callback, rather than allocating a closure per request.
+                task.rpc_id = id  # type: ignore
+                task.add_done_callback(self._their_request_done)
+                return task
             else:
                 # Request is a notification, no response expected.
                 self.notification_tasks.add(task)
                 task.add_done_callback(self.notification_tasks.discard)
 
+    def _their_request_done(self, task: Task):
+        self.their_requests.pop(task.rpc_id, None)  # type: ignore
+
+    def _handle_notification_inline(self, req: Request) -> bool:
+        """Runs the handler for a notification immediately if it can't suspend.
+
+        Creating a task costs an allocation and an extra trip around the event loop, which is
+        wasted on the many notifications handled by plain functions (and on `$/cancelRequest`).
+
+        Returns False if the notification still needs to be handled by `_on_request`.
+        Notifications are handled in the order they arrive, so while an earlier one is still
+        pending on its task this always returns False.
+        """
+        if self.status != RpcServerStatus.running or self.notification_tasks:
+            return False
+        is_cancel = req.method == _CANCEL_REQUEST
+        if not is_cancel and (
+            req.method not in self.dispatcher or self.dispatcher.is_async(req.method)
+        ):
+            return False
+        try:
+            if is_cancel:
+                self._cancel_their_request(req.params)
+                return True
+            T = self.dispatcher.param_type(req.method)
+            params = req.params if T is Any else ofdict(T, req.params)
+            result = self.dispatcher[req.method](params)
+        except Exception as e:
+            logger.exception(
+                f"{self} {req} unhandled {type(e).__name__}:\n{e}\nThis is likely caused by a bug in the {req.method} method handler."
+            )
+            return True
+        if asyncio.iscoroutine(result):
+            task = asyncio.create_task(result, name=f"{self.name} handle {req}")
+            self.notification_tasks.add(task)
+            task.add_done_callback(self.notification_tasks.discard)
+        elif result is not None:
+            logger.warning(
+                f"notification handler {req.method} returned a value, this will be ignored"
+            )
+        return True
+
+    def _cancel_their_request(self, params: Any) -> None:
+        """Cancels the peer's request named by the params of a `$/cancelRequest` notification."""
+        if not isinstance(params, dict) or not "id" in params:
+            raise invalid_params('params must be a dict with "id" key')
+        t = self.their_requests.get(params["id"], None)
+        if t is not None:
+            t.cancel("requested by peer")
+        # if t is None then the request has already completed and removed itself from self.their_requests
+
+    async def _respond(self, data: bytes):
+        """Sends a response to one of my peer's requests, or adds it to the batch being handled."""
+        batch = _response_batch.get()
+        if batch is None:
+            await self._send_bytes(data)
+        else:
+            batch.append(data)
+
     async def _on_request(self, req: Request) -> None:
         """Handles a request from the peer."""
         try:
             result = await self._on_request_core(req)
         except asyncio.CancelledError as e:
             if not req.is_notification:
-                await self._send(
-                    Response(
-                        id=req.id,
-                        error=ResponseError(code=ErrorCode.request_cancelled, message=str(e)),
-                    )
+                await self._respond(
+                    _error_response_bytes(req.id, ErrorCode.request_cancelled, str(e))
                 )
         except ResponseError as e:
-            await self._send(Response(id=req.id, error=e))
+            await self._respond(_error_response_bytes(req.id, e.code, e.message, e.data))
         except Exception as e:
             # if we get here, the method handler code has a bug.
             logger.exception(
                 f"{self} {req} unhandled {type(e).__name__}:\n{e}\nThis is likely caused by a bug in the {req.method} method handler."
             )
-            await self._send(
-                Response(
-                    id=req.id,
-                    error=ResponseError(code=ErrorCode.server_error, message=str(e)),
-                )
-            )
+            await self._respond(_error_response_bytes(req.id, ErrorCode.server_error, str(e)))
         else:
             if not req.is_notification:
-                await self._send(Response(id=req.id, result=result))
+                if result is None:
+                    # void methods are common (eg shutdown), so skip building a Response for them.
+                    await self._respond(_NULL_RESULT_TEMPLATE % _dumps(req.id))
+                else:
+                    await self._respond(Response(id=req.id, result=result).to_bytes())
             else:
                 if result is not None:
                     logger.warning(
@@ -649,7 +963,7 @@ class RpcServer:
     async def _on_request_core(self, req: Request):
         """Inner part of self._on_request, without error handling."""
         if self.status == RpcServerStatus.preinit:
-            INIT_METHOD = "initialize"
+            INIT_METHOD = _INITIALIZE
             if self.init_mode == InitializationMode.ExpectInit:
                 if req.method == INIT_METHOD:
                     self.status = RpcServerStatus.running
@@ -662,23 +976,17 @@ class RpcServer:
             else:
                 raise internal_error("invalid server state")
         if self.status == RpcServerStatus.shutdown:
-            if req.method == "shutdown":
-                if "shutdown" in self.dispatcher:
-                    return await self.dispatcher.dispatch("shutdown", None)
+            if req.method == _SHUTDOWN:
+                if _SHUTDOWN in self.dispatcher:
+                    return await self.dispatcher.dispatch(_SHUTDOWN, None)
                 else:
                     return None
             raise invalid_request("server has shut down")
 
-        if req.method == "$/cancelRequest":
+        if req.method == _CANCEL_REQUEST:
             if not req.is_notification:
                 raise invalid_request("cancel request must be a notification")
-            if not isinstance(req.params, dict) or not "id" in req.params:
-                raise invalid_params('params must be a dict with "id" key')
-            id = req.params["id"]
-            t = self.their_requests.get(id, None)
-            if t is not None:
-                t.cancel("requested by peer")
-            # if t is None then the request has already completed and removed itself from self.their_requests
+            self._cancel_their_request(req.params)
             return None
 
         if req.method not in self.dispatcher:
@@ -686,7 +994,7 @@ class RpcServer:
 
         T = self.dispatcher.param_type(req.method)
         try:
-            params = ofdict(T, req.params)
+            params = req.params if T is Any else ofdict(T, req.params)
         except TypeError as e:
             message = f"{req.method} {type(e).__name__} failed to decode params to {T}: {e}"
             logger.exception(message)
@@ -3,7 +3,7 @@ Author: E.W.Ayers <contact@edayers.com>
 This file is adapted from  https://github.com/EdAyers/sss
 """
 from abc import ABC, abstractmethod
-from typing import Awaitable, Protocol
+from typing import Awaitable, List, Protocol
 
 """
 Abstract definition of Transport for RPC.
@@ -51,3 +51,11 @@ class Transport(ABC):
     @abstractmethod
     def send(self, data: bytes) -> Awaitable[None]:
         ...
+
+    async def send_many(self, datas: List[bytes]) -> None:
+        """Send several messages in order.
+
+        Transports that can write multiple framed messages at once should override this.
+        """
+        for data in datas:
+            await self.send(data)
@@ -1,18 +1,11 @@
 import asyncio
 import logging
 import sys
-import time
 from typing import Literal, Optional, Union
 
-from rift.__about__ import __version__
 from rift.rpc.io_transport import AsyncStreamTransport, create_pipe_streams
 from rift.server.lsp import LspServer
 
-try:
-    from rift.llm.gpt4all_model import Gpt4AllModel, Gpt4AllSettings
-except ImportError as e:
-    Gpt4AllModel = e
-
 logger = logging.getLogger(__name__)
 
 
@@ -36,13 +29,10 @@ def rift_splash():
 
     """
 
-    def stream_string(string):
-        for char in string:
-            print(char, end="", flush=True)
-            time.sleep(0.0012)
-            # print('\r', end='')
-
-    stream_string(_splash)
+    # written in one go to stderr (like the logs) rather than typed out a character at a time,
+    # which took hundreds of writes and most of a second of startup.
+    sys.stderr.write(_splash)
+    sys.stderr.flush()
 
 
 # ref: https://stackoverflow.com/questions/64303607/python-asyncio-how-to-read-stdin-and-write-to-stdout
@@ -63,6 +53,10 @@ class CodeCapabilitiesServer:
     ):
         self.lsp_host = lsp_host
         self.lsp_port = lsp_port
+        if lsp_port != "stdio":
+            # validated once here so that the tcp entry points can use them as-is.
+            self._tcp_host: str = str(lsp_host)
+            self._tcp_port: int = int(lsp_port)
 
     async def on_lsp_connection(self, reader, writer):
         transport = AsyncStreamTransport(reader, writer)
@@ -81,22 +75,18 @@ class CodeCapabilitiesServer:
             )
 
     async def run_lsp_tcp_client_mode(self):
-        assert isinstance(self.lsp_host, str)
-        assert isinstance(self.lsp_port, int)
-        reader, writer = await asyncio.open_connection(self.lsp_host, self.lsp_port)
+        reader, writer = await asyncio.open_connection(self._tcp_host, self._tcp_port)
         transport = AsyncStreamTransport(reader, writer)
         await self.run_lsp(transport)
 
     async def run_lsp_tcp(self):
-        assert isinstance(self.lsp_host, str)
-        assert isinstance(self.lsp_port, int)
         try:
             server = await asyncio.start_server(
-                self.on_lsp_connection, self.lsp_host, self.lsp_port
+                self.on_lsp_connection, self._tcp_host, self._tcp_port
             )
         except OSError as e:
             logger.error(str(e))
-            logger.info(f"try connecting to {self.lsp_host}:{self.lsp_port}")
+            logger.info(f"try connecting to {self._tcp_host}:{self._tcp_port}")
             return await self.run_lsp_tcp_client_mode()
         else:
             async with server:
@@ -129,7 +119,7 @@ class CodeCapabilitiesServer:
         loop = asyncio.get_event_loop()
         lsp_task = await self._run_forever_fut()
         await lsp_task
-        logger.debug(f"exiting {type(self).__name__}.listen_forever")
+        logger.debug("exiting %s.listen_forever", type(self).__name__)
 
 
 def create_metaserver(
@@ -149,6 +139,8 @@ def create_metaserver(
         - debug: if true, print debug messages.
     """
     if version:
+        from rift.__about__ import __version__
+
         print(__version__)
         return
     from rich.console import Console
@@ -170,6 +162,22 @@ def create_metaserver(
     return metaserver
 
 
+def use_fast_event_loop() -> bool:
+    """Switches asyncio over to uvloop's event loop if it is installed.
+
+    The server is I/O bound (every keystroke round-trips through the LSP transport), so a faster
+    event loop directly reduces per-message overhead. Returns true if the loop policy was changed.
+    """
+    if sys.platform == "win32":
+        return False
+    try:
+        import uvloop
+    except ImportError:
+        return False
+    asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+    return True
+
+
 def main(
     host: LspHost = "127.0.0.1",
     port: LspPort = 7797,
@@ -178,10 +186,16 @@ def main(
 ):
     metaserver = create_metaserver(host, port, version, debug)
     if metaserver:
+        # asyncio's debug mode is more useful with the default event loop.
+        if not debug and use_fast_event_loop():
+            logger.debug("using uvloop event loop")
         asyncio.run(metaserver.run_forever(), debug=debug)
 
 
 if __name__ == "__main__":
-    import fire
+    if len(sys.argv) > 1:
+        import fire
 
-    fire.Fire(main)
+        fire.Fire(main)
+    else:
+        main()
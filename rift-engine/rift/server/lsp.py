@@ -1,11 +1,13 @@
 import asyncio
+import functools
 import glob
 import json
 import logging
 import os
 import uuid
+from collections import deque
 from dataclasses import dataclass
-from typing import Any, Dict, List, Optional, Tuple
+from typing import Any, ClassVar, Dict, List, Optional, Set, Tuple
 
 import rift.lsp.types as lsp
 from rift.agents import AGENT_REGISTRY, Agent, AgentParams, AgentRegistryResult
@@ -19,35 +21,93 @@ from rift.util.ofdict import ofdict
 logger = logging.getLogger(__name__)
 
 
+_LSP_MESSAGE_TYPES = {
+    logging.DEBUG: 4,
+    logging.INFO: 3,
+    logging.WARNING: 2,
+    logging.ERROR: 1,
+}
+
+
 class LspLogHandler(logging.Handler):
+    """Forwards log records at INFO and above to the client as `window/logMessage` notifications.
+
+    Records are queued and sent one at a time by a single drain task, rather than with a task per record.
+    At most `max_pending` messages are held; beyond that they are dropped and the client is told how many were lost.
+    Records logged from other threads are handed over to the server's event loop.
+    """
+
+    max_pending: ClassVar[int] = 256
+
     def __init__(self, server: "LspServer"):
-        super().__init__()
+        super().__init__(level=logging.INFO)
         self.server = server
-        self.tasks: set[asyncio.Task] = set()
+        try:
+            self.loop: Optional[asyncio.AbstractEventLoop] = asyncio.get_running_loop()
+        except RuntimeError:
+            self.loop = None
+        self.pending: deque[dict] = deque()
+        self.dropped = 0
+        self._drain_task: Optional[asyncio.Task] = None
 
     def emit(self, record: logging.LogRecord) -> None:
         if self.server.status != RpcServerStatus.running:
             return
-        t_map = {
-            logging.DEBUG: 4,
-            logging.INFO: 3,
-            logging.WARNING: 2,
-            logging.ERROR: 1,
-        }
-        level = t_map.get(record.levelno, 4)
+        level = _LSP_MESSAGE_TYPES.get(record.levelno, 4)
         if level > 3:
             return
-        t = asyncio.create_task(
-            self.server.notify(
-                "window/logMessage",
-                {
-                    "type": level,
-                    "message": self.format(record),
-                },
-            )
-        )
-        self.tasks.add(t)
-        t.add_done_callback(self.tasks.discard)
+        if self.formatter is None and not record.exc_info and not record.stack_info:
+            # the default formatter would only produce `%(message)s` here.
+            text = record.getMessage()
+        else:
+            text = self.format(record)
+        message = {"type": level, "message": text}
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            loop = None
+        if loop is not None and (self.loop is None or loop is self.loop):
+            self.loop = loop
+            self._enqueue(message)
+        elif self.loop is not None and not self.loop.is_closed():
+            self.loop.call_soon_threadsafe(self._enqueue, message)
+
+    def _enqueue(self, message: dict):
+        if len(self.pending) >= self.max_pending:
+            self.dropped += 1
+        else:
+            self.pending.append(message)
+        if self._drain_task is None:
+            self._drain_task = asyncio.create_task(self._drain())
+
+    async def _drain(self):
+        try:
+            while (self.pending or self.dropped) and self.server.status == RpcServerStatus.running:
+                if self.pending:
+                    message = self.pending.popleft()
+                else:
+                    # messages are only dropped while the queue is full, so this comes right after the ones that were kept.
+                    message = {"type": 2, "message": f"{self.dropped} log messages were dropped"}
+                    self.dropped = 0
+                await self.server.notify("window/logMessage", message)
+        finally:
+            self._drain_task = None
+
+
+_LANGUAGES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "languages.json")
+
+
+@functools.lru_cache(maxsize=None)
+def _language_ids() -> Dict[str, str]:
+    """Maps file extensions (eg ".py") to their language id in languages.json."""
+    with open(_LANGUAGES_PATH, "r") as f:
+        languages = json.load(f)["languages"]
+    ids: Dict[str, str] = {}
+    for details in languages:
+        for extension in details.get("extensions", []):
+            # the first language listing an extension wins.
+            ids.setdefault(extension, details["id"])
+    return ids
 
 
 @dataclass
@@ -90,136 +150,190 @@ class LspServer(BaseLspServer):
             change=lsp.TextDocumentSyncKind.incremental,
         )
         self.active_agents = {}
-        self._loading_task = None
-        self._chat_loading_task = None
+        self._agent_tasks: Set[asyncio.Task] = set()
+        self._config_changed = asyncio.Event()
+        self._config_settled: Optional[asyncio.Future] = None
+        self._config_worker: Optional[asyncio.Task] = None
+        self._loaded_keys: Dict[str, tuple] = {}
+        self._loaded_settings: Optional[dict] = None
         self.logger = logging.getLogger(f"rift")
         self.logger.addHandler(LspLogHandler(self))
 
+    def _shutdown(self):
+        for t in self._agent_tasks:
+            t.cancel("shutdown")
+        if self._config_worker is not None:
+            self._config_worker.cancel("shutdown")
+        if self._config_settled is not None:
+            self._config_settled.cancel("shutdown")
+        super()._shutdown()
+
     @rpc_method("workspace/didChangeConfiguration")
     async def on_workspace_did_change_configuration(self, params: lsp.DidChangeConfigurationParams):
         logger.info("workspace/didChangeConfiguration")
         await self.get_config()
 
     @rpc_method("morph/loadFiles")
-    def load_documents(self, params: LoadFilesParams) -> LoadFilesResult:
+    async def load_documents(self, params: LoadFilesParams) -> LoadFilesResult:
         """
         Accepts a set of file paths, processes them into full, qualified paths.
         Opens each file and reads its text, stores the text into a list of TextDocumentItem.
         If a language can be determined from the file's extension using languages.json, sets languageId, else defaults to "*".
-        Updates dictionary of documents tracked by LspServer.
+        The globbing and the file reads run on worker threads, with the files read concurrently.
         """
-        # Try getting absolute path to current directory, default to current working directory on exception.
-        try:
-            current_dir = os.path.abspath(__file__)
-        except:
-            current_dir = os.getcwd()
-        # Open the languages.json file to get details for mapping file extension to language id
-        with open(os.path.join(current_dir, "languages.json"), "r") as f:
-            language_map = json.loads(f)
-
-        # Helper function to find the matching language id, given a file path and language map
-        # The id of the language is returned, if found in the language map
-        def find_matching_language(
-            filepath: str, language_map: Dict[str, List[Dict[str, str]]]
-        ) -> Optional[str]:
-            # Getting the file extension
-            extension = filepath.split(".")[-1]
-
-            # loop over the details in the language map
-            for details in language_map["languages"]:
-                # Check if file extension matches any in the list, if yes, return that language id
-                if extension in details.get("extensions", []):
-                    return details["id"]
-
-            # No language match found, return None
-            return None
-
-        # Helper function to expand all environment variables in file paths
-        def preprocess_filepaths(filepaths: List[str]) -> List[str]:
-            processed_filepaths = []
-            for filepath in filepaths:
-                # Expanding all env variables in the file path
-                processed_filepaths.append(os.path.expandvars(filepath))
-            return processed_filepaths
+        language_ids = _language_ids()
 
-        # Helper function to join all the file paths provided
-        def join_filepaths(filepaths: List[str]) -> List[str]:
+        # Helper function to expand the environment variables and glob patterns in the file paths
+        def expand_filepaths(filepaths: List[str]) -> List[str]:
+            expanded = []
             for filepath in filepaths:
-                # Yielding all file paths matching the glob pattern
-                yield from glob.glob(filepath, root="/" if filepath.startswith("/") else None)
+                filepath = os.path.expandvars(filepath)
+                if glob.has_magic(filepath):
+                    expanded.extend(glob.glob(filepath, recursive=True))
+                elif os.path.lexists(filepath):
+                    # a plain path, which glob would only check for existence
+                    expanded.append(filepath)
+            return expanded
+
+        cwd = os.getcwd()
+
+        # Helper function to read one file, returning its uri and text
+        def read_file(file_path: str) -> Tuple[str, str]:
+            # Constructing the Uri for each file (os.path.join leaves absolute paths as they are)
+            uri = "file://" + os.path.join(cwd, file_path)
+            with open(file_path, "r") as f:
+                return uri, f.read()
+
+        file_paths = await asyncio.to_thread(expand_filepaths, params.patterns)
+        results = await asyncio.gather(
+            *(asyncio.to_thread(read_file, file_path) for file_path in file_paths),
+            return_exceptions=True,
+        )
 
         # Initialize dictionary to store resulting TextDocumentItems
-        result_documents: Dict[str, lsp.TextDocumentItem]
-        # Process and combine all file paths, and for each...
-        for file_path in join_filepaths(preprocess_filepaths(params.patterns)):
-            # Open the file for reading
-            with open(file_path, "r") as f:
-                # Reading the content of the file
-                text = f.read()
+        result_documents: Dict[str, lsp.TextDocumentItem] = {}
+        for file_path, result in zip(file_paths, results):
+            if isinstance(result, BaseException):
+                logger.warning("could not read %s: %s", file_path, result)
+                continue
+            uri, text = result
             # Creating a TextDocumentItem instance for each file
-            doc_item = lsp.TextDocumentItem(
+            result_documents[uri] = lsp.TextDocumentItem(
                 text=text,
-                # Constructing the Uri for each file
-                uri="file://" + os.path.join(os.getcwd(), str(file_path))
-                if not file_path.startswith("/")
-                else str(file_path),
+                uri=uri,
                 # Finding the language ID for each file, or using "*" if language ID cannot be determined
-                languageId=find_matching_language(file_path, language_map) or "*",
+                languageId=language_ids.get(os.path.splitext(file_path)[1], "*"),
                 version=1,
             )
-            # Adding the TextDocumentItem to the result documents dictionary
-            result_documents[doc_item.uri] = doc_item
+        return LoadFilesResult(documents=result_documents)
 
     @rpc_method("morph/applyWorkspaceEdit")
     async def on_workspace_did_change_configuration(self, params: lsp.ApplyWorkspaceEditParams):
         return await self.apply_workspace_edit(params)
 
+    config_settle_time: ClassVar[float] = 1.0
+    """Seconds without a further config change before a reload starts, once models have been created."""
+
     async def get_config(self):
         """This should be called whenever the user changes the model config settings.
 
-        It should also be called immediately after initialisation."""
-        if self._loading_task is not None:
-            idx = getattr(self, "_loading_idx", 0) + 1
-            logger.debug(f"Queue of set_model_config tasks: {idx}")
-            self._loading_idx = idx
-            self._loading_task.cancel()
-            # give user typing in config some time to settle down
-            await asyncio.sleep(1)
+        It should also be called immediately after initialisation.
+        Returns once the most recent config has been loaded; a burst of calls shares a single reload."""
+        if self._config_worker is None or self._config_worker.done():
+            self._config_worker = asyncio.create_task(self._run_config_worker())
+        if self._config_settled is None:
+            self._config_settled = asyncio.get_running_loop().create_future()
+        settled = self._config_settled
+        self._config_changed.set()
+        # shielded so that a caller giving up doesn't cancel the reload that other callers are waiting on.
+        await asyncio.shield(settled)
+
+    async def _run_config_worker(self):
+        while True:
+            await self._config_changed.wait()
+            if self.chat_model is not None or self.completions_model is not None:
+                # give user typing in config some time to settle down
+                while True:
+                    self._config_changed.clear()
+                    try:
+                        await asyncio.wait_for(self._config_changed.wait(), self.config_settle_time)
+                    except asyncio.TimeoutError:
+                        break
+            self._config_changed.clear()
+            load = asyncio.create_task(self._load_config())
+            changed = asyncio.create_task(self._config_changed.wait())
             try:
-                await self._loading_task
-            except (asyncio.CancelledError, TypeError):
-                pass
-            if self._loading_idx != idx:
-                logger.debug(f"loading task {idx} was cancelled, but a new one was started")
-                return
-            # only the most recent request will make it here.
+                await asyncio.wait((load, changed), return_when=asyncio.FIRST_COMPLETED)
+            finally:
+                changed.cancel()
+                if not load.done():
+                    load.cancel()
+            if not load.done():
+                # a newer config arrived; let the old load unwind, then start over with the latest one.
+                logger.debug("loading cancelled")
+                await asyncio.wait((load,))
+                continue
+            if self._config_changed.is_set():
+                # the load finished alongside a newer change; keep the callers waiting for the reload of that one.
+                logger.debug("config changed during load")
+                continue
+            settled, self._config_settled = self._config_settled, None
+            if settled is None or settled.done():
+                continue
+            if load.cancelled():
+                settled.cancel()
+            elif load.exception() is not None:
+                settled.set_exception(load.exception())
+            else:
+                settled.set_result(None)
+
+    async def _load_config(self):
         settings = await self.get_workspace_configuration(section="rift")
         if not isinstance(settings, list) or len(settings) != 1:
             raise RuntimeError(f"Invalid settings:\n{settings}\nExpected a list of dictionaries.")
         settings = settings[0]
+        if settings == self._loaded_settings:
+            # editors resend the settings on unrelated changes, so skip parsing them again.
+            logger.debug("config unchanged")
+            return
         config: ModelConfig = ModelConfig.parse_obj(settings)
-        if self.chat_model and self.completions_model and self.model_config == config:
+        # models whose part of the config is unchanged (and which finished loading) are kept as they are.
+        changed = [
+            (name, create, key)
+            for name, create, key in [
+                ("completions_model", config.create_completions, config.completions_key()),
+                ("chat_model", config.create_chat, config.chat_key()),
+            ]
+            if getattr(self, name) is None or self._loaded_keys.get(name) != key
+        ]
+        if not changed:
             logger.debug("config unchanged")
+            self._loaded_settings = settings
             return
         self.model_config = config
         logger.info(f"{self} recieved model config {config}")
-        for k, h in self.active_agents.items():
-            asyncio.create_task(h.cancel("config changed"))
-        self.completions_model = config.create_completions()
-        self.chat_model = config.create_chat()
-
-        self._loading_task = asyncio.gather(
-            self.completions_model.load(),
-            self.chat_model.load(),
-        )
-        try:
-            await self._loading_task
-        except asyncio.CancelledError:
-            logger.debug("loading cancelled")
-        else:
-            logger.info(f"{self} finished loading")
-        finally:
-            self._loading_task = None
+        names = {name for name, _, _ in changed}
+        # the agents running on the old models are cancelled before the new ones start loading.
+        cancels = [
+            h.cancel("config changed")
+            for h in self.active_agents.values()
+            if names.intersection(h.models)
+        ]
+        if cancels:
+            await asyncio.gather(*cancels, return_exceptions=True)
+        loads = []
+        for name, create, key in changed:
+            model = create()
+            setattr(self, name, model)
+            self._loaded_keys.pop(name, None)
+            loads.append(self._load_model(name, model, key))
+        await asyncio.gather(*loads)
+        self._loaded_settings = settings
+        logger.info(f"{self} finished loading")
+
+    async def _load_model(self, name: str, model, key: tuple):
+        await model.load()
+        self._loaded_keys[name] = key
 
     def parse_current_chat_config(self) -> Tuple[str, str, str]:
         return parse_type_name_path(self.model_config.chatModel)
@@ -230,29 +344,26 @@ class LspServer(BaseLspServer):
     async def send_update(self, msg: str):
         await self.notify("morph/send_update", {"msg": msg})
 
-    async def ensure_completions_model(self):
+    async def _ensure_model(self, name: str):
+        """Returns the model stored in the `name` attribute, loading the config first if there isn't one yet.
+        Falls back to a gpt-3.5-turbo model if the config can't be loaded."""
         try:
-            if self.completions_model is None:
+            if getattr(self, name) is None:
                 await self.get_config()
-            assert self.completions_model is not None
-            return self.completions_model
+            model = getattr(self, name)
+            assert model is not None
+            return model
         except:
             config = ModelConfig(
                 chatModel="openai:gpt-3.5-turbo", completionsModel="openai:gpt-3.5-turbo"
             )
-            return config.create_completions()
+            return config.create_chat() if name == "chat_model" else config.create_completions()
+
+    async def ensure_completions_model(self):
+        return await self._ensure_model("completions_model")
 
     async def ensure_chat_model(self):
-        try:
-            if self.chat_model is None:
-                await self.get_config()
-            assert self.chat_model is not None
-            return self.chat_model
-        except:
-            config = ModelConfig(
-                chatModel="openai:gpt-3.5-turbo", completionsModel="openai:gpt-3.5-turbo"
-            )
-            return config.create_chat()
+        return await self._ensure_model("chat_model")
 
     @rpc_method("morph/restart_agent")
     async def on_restart_agent(self, params: AgentIdParams) -> CreateAgentResult:
@@ -288,9 +399,12 @@ class LspServer(BaseLspServer):
 
         self.active_agents[agent_id] = agent
         t = asyncio.create_task(agent.main())
+        # the event loop only keeps weak references to tasks.
+        self._agent_tasks.add(t)
+        t.add_done_callback(self._agent_tasks.discard)
 
         def main_callback(fut):
-            if fut.exception():
+            if not fut.cancelled() and fut.exception():
                 logger.info(f"[on_run] caught exception={fut.exception()=}")
 
         t.add_done_callback(main_callback)
@@ -304,9 +418,11 @@ class LspServer(BaseLspServer):
 
     @rpc_method("morph/delete")
     async def on_delete(self, params: AgentIdParams):
-        agent: Agent = self.active_agents.pop(params.id)
+        agent = self.active_agents.pop(params.id, None)
+        if agent is None:
+            logger.error(f"no agent with id {params.id}")
+            return
         await agent.cancel("cancel bc delete", False)
-        del agent
 
     @rpc_method("morph/listAgents")
     def on_list_agents(self, _: Any) -> List[AgentRegistryResult]:
@@ -314,16 +430,15 @@ class LspServer(BaseLspServer):
 
     @rpc_method("morph/accept")
     async def on_accept(self, params: AgentIdParams):
-        agent = self.active_agents.get(params.id)
+        # popped before accepting, so a repeated accept can't run twice for the same agent.
+        agent = self.active_agents.pop(params.id, None)
         if agent is not None:
             await agent.accept()
-            self.active_agents.pop(params.id, None)
 
     @rpc_method("morph/reject")
     async def on_reject(self, params: AgentIdParams):
-        agent = self.active_agents.get(params.id)
+        agent = self.active_agents.pop(params.id, None)
         if agent is not None:
             await agent.reject()
-            self.active_agents.pop(params.id, None)
         else:
             logger.error(f"no agent with id {params.id}")
@@ -1,25 +1,37 @@
+import bisect
 import itertools
 import logging
 from dataclasses import dataclass
 from typing import Iterable, Union
 
 from rift.lsp.types import Position, Range, TextDocumentContentChangeEvent
+from rift.util.misc import utf16_len
 from rift.util.ofdict import ofdict, todict
 
 logger = logging.getLogger(__name__)
 
 
 class RangeSet:
-    ranges: set[Range]
+    """A set of disjoint ranges, kept sorted by start position.
+
+    Overlapping or touching ranges are merged on insertion, so `add` only needs to
+    bisect for its neighbours rather than rescanning every range in the set.
+    """
+
+    __slots__ = ("ranges", "_starts")
+    ranges: list[Range]
+    _starts: list[Position]
 
     def __iter__(self):
         yield from self.ranges
 
     def __init__(self, ranges: "Iterable[Union[Range, RangeSet]]" = []):
-        self.ranges = set()
+        self.ranges = []
+        self._starts = []
         for range in ranges:
             if isinstance(range, RangeSet):
-                self.ranges.update(range.ranges)
+                for r in range.ranges:
+                    self.add(r)
             elif isinstance(range, Range):
                 self.add(range)
             else:
@@ -38,63 +50,94 @@ class RangeSet:
         return all(len(r) == 0 for r in self.ranges)
 
     def add(self, range: Range):
-        acc = range
-        ranges = set()
-        for r in self.ranges:
-            if acc.end in r or acc.start in r:
-                acc = Range.union([acc, r])
-            else:
-                ranges.add(r)
-        ranges.add(acc)
-        self.ranges = ranges
-        # logger.info("done adding")
+        ranges = self.ranges
+        start, end = range.start, range.end
+        lo = bisect.bisect_right(self._starts, start)
+        if lo > 0 and start <= ranges[lo - 1].end:
+            lo -= 1
+            start = ranges[lo].start
+        hi = lo
+        while hi < len(ranges) and ranges[hi].start <= end:
+            hi += 1
+        if hi > lo:
+            end = max(end, ranges[hi - 1].end)
+            if hi - lo == 1 and ranges[lo].start == start and ranges[lo].end == end:
+                return
+        acc = Range(start, end)
+        ranges[lo:hi] = [acc]
+        self._starts[lo:hi] = [start]
 
     def normalize(self):
-        classes: list[Range] = []
-        for r in self.ranges:
-            if len(r) == 0:
-                continue
-            ins = []
-            outs = []
-            for c in classes:
-                if c.end in r or c.start in r:
-                    ins.append(c)
-                else:
-                    outs.append(c)
-            if len(ins) > 0:
-                x = Range.union([r] + ins)
-                outs.append(x)
-            else:
-                outs.append(r)
-            classes = outs
-        return RangeSet(classes)
+        return RangeSet(r for r in self.ranges if len(r) != 0)
 
     def __contains__(self, pos: Position):
-        for range in self.ranges:
-            if pos in range:
-                return True
-        return False
+        i = bisect.bisect_right(self._starts, pos)
+        return i > 0 and pos <= self.ranges[i - 1].end
 
     def cover(self):
         if len(self.ranges) == 0:
             raise ValueError("empty range set")
-        return Range.union(self.ranges)
+        return Range(self.ranges[0].start, self.ranges[-1].end)
 
     def apply_edit(self, edit: TextDocumentContentChangeEvent):
-        if edit.range is None:
-            pass
-        ranges = set()
-        n = len(edit.text)
-        δ = n - len(edit.range)
-        for range in self.ranges:
-            if edit.range.end <= range.start:
-                ranges.add(range + δ)
-            elif edit.range.start >= range.end:
-                ranges.add(range)
-            else:
-                if edit.range.start in range:
-                    ranges.add(Range(range.start, edit.range.start))
-                if edit.range.end in range:
-                    ranges.add(Range(edit.range.start + n, range.end + δ))
-        self.ranges = ranges
-        # return RangeSet(ranges)
+        self.apply_edits([edit])
+
+    def apply_edits(self, edits: Iterable[TextDocumentContentChangeEvent]):
+        """Updates the ranges for a sequence of edits, each relative to the document left by the previous one
+        (ie in the order of `DidChangeTextDocumentParams.contentChanges`).
+
+        Positions are mapped in line/character space, so no document context is needed. Ranges that end
+        before an edit are found by bisection and left alone, as are the ranges starting on a later line
+        when the edit doesn't change the number of lines, so each edit only visits the ranges it moves.
+        """
+        for edit in edits:
+            if edit.range is None:
+                # the whole document was replaced.
+                self.ranges = []
+                self._starts = []
+                continue
+            start, end = edit.range.start, edit.range.end
+            new_end = _end_of_insert(start, edit.text)
+            lo = bisect.bisect_left(self._starts, start)
+            if lo > 0 and start < self.ranges[lo - 1].end:
+                lo -= 1
+            if lo == len(self.ranges):
+                # the edit comes after every range.
+                continue
+            hi = len(self.ranges)
+            if new_end.line == end.line:
+                # the edit doesn't add or remove lines, so ranges starting on a later line don't move.
+                hi = bisect.bisect_left(self._starts, Position(end.line + 1, 0), lo)
+            ranges = []
+            for range in self.ranges[lo:hi]:
+                if end <= range.start:
+                    ranges.append(
+                        Range(
+                            _map_past_edit(range.start, end, new_end),
+                            _map_past_edit(range.end, end, new_end),
+                        )
+                    )
+                elif start >= range.end:
+                    ranges.append(range)
+                else:
+                    if start in range:
+                        ranges.append(Range(range.start, start))
+                    if end in range:
+                        ranges.append(Range(new_end, _map_past_edit(range.end, end, new_end)))
+            self.ranges[lo:hi] = ranges
+            self._starts[lo:hi] = [r.start for r in ranges]
+
+
+def _end_of_insert(pos: Position, text: str) -> Position:
+    """The position just after `text` once it has been inserted at `pos`."""
+    line_delta = text.count("\n")
+    if line_delta == 0:
+        return Position(pos.line, pos.character + utf16_len(text))
+    return Position(pos.line + line_delta, utf16_len(text[text.rindex("\n") + 1 :]))
+
+
+def _map_past_edit(pos: Position, end: Position, new_end: Position) -> Position:
+    """Maps a position at or after the end of an edit's range to where it is once the edit is applied."""
+    if pos.line == end.line:
+        return Position(new_end.line, new_end.character + pos.character - end.character)
+    return Position(pos.line + new_end.line - end.line, pos.character)
@@ -1,21 +1,41 @@
 import asyncio
 import logging
-from typing import Any, AsyncIterable, Callable, Optional
+from collections import deque
+from typing import Any, AsyncIterable, Callable, Deque, Optional
 
 logger = logging.getLogger(__name__)
 
 
 class TextStream:
+    __slots__ = (
+        "_feed_task",
+        "_waiter",
+        "_eof",
+        "_chunks",
+        "_size",
+        "_scan_sep",
+        "_scanned",
+        "_loop",
+        "_on_cancel",
+    )
     _feed_task: Optional[asyncio.Task]
     _waiter: Optional[asyncio.Future[None]]
     _eof: bool
-    _buffer: str  # [todo] use io.StringIO
+    _chunks: Deque[str]
+    """The buffered text, in the chunks it was fed in. Appending to a str would copy the whole buffer each time."""
+    _size: int
+    _scan_sep: Optional[str]
+    _scanned: int
+    """The first `_scanned` characters of the buffer are known not to contain `_scan_sep`."""
     _loop: asyncio.AbstractEventLoop
     _on_cancel: Optional[Callable[[], None]]
 
     def __init__(self, loop=None, on_cancel=None):
         self._feed_task = None
-        self._buffer = ""
+        self._chunks = deque()
+        self._size = 0
+        self._scan_sep = None
+        self._scanned = 0
         self._waiter = None
         self._eof = False
         self._loop = asyncio.get_event_loop() if loop is None else loop
@@ -28,14 +48,15 @@ class TextStream:
         self._wakeup_waiter()
 
     def at_eof(self):
-        return self._eof and not self._buffer
+        return self._eof and not self._size
 
     def feed_data(self, data: str):
         if self._eof:
             raise RuntimeError("feed_data() called after feed_eof()")
         if len(data) == 0:
             return
-        self._buffer += data
+        self._chunks.append(data)
+        self._size += len(data)
         self._wakeup_waiter()
 
     def _wakeup_waiter(self):
@@ -74,16 +95,16 @@ class TextStream:
         if n < 0:
             while not self._eof:
                 await self._wait_for_data("read()")
-            text = self._buffer
-            self._buffer = ""
-            return text
-        if not self._buffer and not self._eof:
+            return self.pop_all()
+        if not self._size and not self._eof:
             await self._wait_for_data(f"read({n})")
         return self.pop(n)
 
     def pop_all(self):
-        text = self._buffer
-        self._buffer = ""
+        text = "".join(self._chunks)
+        self._chunks.clear()
+        self._size = 0
+        self._scanned = 0
         return text
 
     def pop(self, n: int):
@@ -94,18 +115,54 @@ class TextStream:
 
         Note that this method does not wait for incoming data.
         """
-        text = self._buffer[:n]
-        self._buffer = self._buffer[n:]
-        return text
+        if n < 0:
+            n = max(self._size + n, 0)
+        if n >= self._size:
+            return self.pop_all()
+        chunks = self._chunks
+        parts = []
+        rest = n
+        while rest > 0:
+            chunk = chunks[0]
+            if len(chunk) <= rest:
+                parts.append(chunks.popleft())
+                rest -= len(chunk)
+            else:
+                parts.append(chunk[:rest])
+                chunks[0] = chunk[rest:]
+                rest = 0
+        self._size -= n
+        self._scanned = max(self._scanned - n, 0)
+        return "".join(parts)
+
+    def _peek(self) -> str:
+        """Returns the whole buffer without popping it, joining the chunks into one."""
+        chunks = self._chunks
+        if len(chunks) > 1:
+            text = "".join(chunks)
+            chunks.clear()
+            chunks.append(text)
+        return chunks[0] if chunks else ""
+
+    def _find(self, sep: str) -> int:
+        """Returns the index of the first `sep` in the buffer, or -1 if there isn't one.
+
+        Text that has already been searched for `sep` isn't searched again."""
+        if sep != self._scan_sep:
+            self._scan_sep = sep
+            self._scanned = 0
+        i = self._peek().find(sep, max(self._scanned - len(sep) + 1, 0))
+        self._scanned = self._size if i < 0 else i
+        return i
 
     async def readexactly(self, n: int):
         if n == 0:
             return ""
         if n < 0:
             raise ValueError("readexactly() called with negative size")
-        while len(self._buffer) < n and not self._eof:
+        while self._size < n and not self._eof:
             await self._wait_for_data(f"readexactly()")
-        if len(self._buffer) < n:
+        if self._size < n:
             assert self._eof
             incomplete: Any = self.pop_all()
             raise EOFError(f"expecting {n - len(incomplete)} more characters but got EOF")
@@ -117,7 +174,7 @@ class TextStream:
     async def __anext__(self):
         """Note this is different to StreamReader which yields lines.
         We just yield everything that is available in the buffer."""
-        while len(self._buffer) == 0:
+        while self._size == 0:
             if self._eof:
                 raise StopAsyncIteration
             else:
@@ -162,7 +219,7 @@ class TextStream:
         if not separator:
             raise ValueError("Separator can't be empty")
         while True:
-            i = self._buffer.find(separator)
+            i = self._find(separator)
             if i >= 0:
                 return self.pop(i + len(separator))
             if self._eof:
@@ -176,7 +233,7 @@ class TextStream:
 
         async def before_worker():
             while True:
-                i = self._buffer.find(sep)
+                i = self._find(sep)
                 if i >= 0:
                     before.feed_data(self.pop(i))
                     before.feed_eof()
@@ -186,7 +243,7 @@ class TextStream:
                     before.feed_data(self.pop_all())
                     before.feed_eof()
                     return
-                if len(self._buffer) > len(sep):
+                if self._size > len(sep):
                     # if any(self._buffer.endswith(sep[:k]) for k in range(1, len(sep))):
                     before.feed_data(self.pop(-len(sep)))
                     # else:
@@ -220,7 +277,7 @@ class TextStream:
             ts = TextStream(self._loop)
             yield ts
             while True:
-                i = self._buffer.find(sep)
+                i = self._find(sep)
                 if i >= 0:
                     ts.feed_data(self.pop(i))
                     ts.feed_eof()
@@ -230,6 +287,6 @@ class TextStream:
                     ts.feed_data(self.pop_all())
                     ts.feed_eof()
                     return
-                if len(self._buffer) > len(sep):
+                if self._size > len(sep):
                     ts.feed_data(self.pop(-len(sep)))
                 await self._wait_for_data("asplit()")
@@ -29,8 +29,19 @@ def accumulate(
 
 
 async def accumulate(asg, func=operator.add, *, initial=None):
-    xs = aiter(asg)  # TODO: this breaks outside of python3.10
-    acc = initial or await anext(xs)  # TODO: this breaks outside of python 3.10
+    """Yields the running totals of `asg`, like `itertools.accumulate`.
+
+    Every total yielded is a new object, so accumulating strings copies all of the text so far at each step.
+    If only the final text is needed, collect the chunks and join them once instead.
+    """
+    xs = asg.__aiter__()
+    if initial is None:
+        try:
+            acc = await xs.__anext__()
+        except StopAsyncIteration:
+            return
+    else:
+        acc = initial
     async for x in xs:
         yield acc
         acc = func(acc, x)
@@ -57,19 +68,103 @@ async def tolist(asg):
     return xs
 
 
-async def buffer(asg: AsyncIterable[A], maxsize=0) -> AsyncIterable[A]:
+_END = object()
+"""Put on a queue by a worker once its source is exhausted."""
+
+
+async def buffer(asg: AsyncIterable[A], maxsize: int = 32) -> AsyncIterable[A]:
+    """Reads ahead from `asg` on a separate task, holding up to `maxsize` items for the consumer.
+
+    A bigger buffer lets a fast producer run further ahead of a slow consumer, at the cost of memory;
+    `maxsize=0` lets it run ahead without bound.
+    """
     q = asyncio.Queue(maxsize=maxsize)
 
     async def worker():
-        async for x in asg:
-            await q.put(x)
-        await q.put(StopAsyncIteration())
+        try:
+            async for x in asg:
+                await q.put(x)
+        except asyncio.CancelledError:
+            # the consumer stopped early and nothing will read the queue again, so no sentinel is posted.
+            aclose = getattr(asg, "aclose", None)
+            if aclose is not None:
+                await aclose()
+            raise
+        except BaseException:
+            await q.put(_END)
+            raise
+        else:
+            await q.put(_END)
 
     t = asyncio.create_task(worker())
-    while True:
+    try:
+        while True:
+            x = await q.get()
+            if x is _END:
+                break
+            yield x
+        # re-raise any error from the source
+        await t
+    finally:
+        if not t.done():
+            t.cancel()
+            await asyncio.wait([t])
+
+
+async def coalesce(
+    asg: AsyncIterable[str], max_len: int = 32, max_wait: float = 0.005
+) -> AsyncIterable[str]:
+    """Joins adjacent string chunks from `asg`, eg single-token LLM deltas, into fewer larger ones.
+
+    A chunk is yielded once it has at least `max_len` characters, contains a newline,
+    or `max_wait` seconds have passed since its first piece arrived, whichever comes first.
+    """
+    q: asyncio.Queue = asyncio.Queue()
+
+    async def worker():
+        try:
+            async for x in asg:
+                q.put_nowait(x)
+        except asyncio.CancelledError:
+            # the consumer stopped early, so close the source rather than leave it suspended.
+            aclose = getattr(asg, "aclose", None)
+            if aclose is not None:
+                await aclose()
+            raise
+        finally:
+            q.put_nowait(_END)
+
+    t = asyncio.create_task(worker())
+    loop = asyncio.get_running_loop()
+    try:
         x = await q.get()
-        if isinstance(x, StopAsyncIteration):
-            break
-        yield x
-    await t
-    # note: t will automatically get cancelled when its reference count drops to zero
+        while x is not _END:
+            parts = [x]
+            size = len(x)
+            deadline = loop.time() + max_wait
+            x = None
+            while size < max_len and "\n" not in parts[-1]:
+                if q.empty():
+                    timeout = deadline - loop.time()
+                    if timeout <= 0:
+                        break
+                    try:
+                        x = await asyncio.wait_for(q.get(), timeout)
+                    except asyncio.TimeoutError:
+                        break
+                else:
+                    x = q.get_nowait()
+                if x is _END:
+                    break
+                parts.append(x)
+                size += len(x)
+                x = None
+            yield "".join(parts)
+            if x is None:
+                x = await q.get()
+        # re-raise any error from the source
+        await t
+    finally:
+        if not t.done():
+            t.cancel()
+            await asyncio.wait([t])
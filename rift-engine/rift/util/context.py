@@ -3,7 +3,9 @@ import contextvars
 import logging
 import os
 import re
-from typing import Callable, List, Optional, TypeVar
+import stat
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional, Tuple, TypeVar
 
 import rift.lsp.types as lsp
 
@@ -12,51 +14,85 @@ T = TypeVar("T")
 logger = logging.getLogger(__name__)
 
 
+_URI_RE = re.compile(r"\[uri\]\((\S+)\)")
+
+
 def extract_uris(user_response: str) -> List[str]:
-    uri_pattern = r"\[uri\]\((\S+)\)"
-    matches = re.findall(uri_pattern, user_response)
-    return [match.replace(" ", "") for match in matches]
+    return [m.group(1).replace(" ", "") for m in _URI_RE.finditer(user_response)]
+
+
+_FILE_CACHE_MAX_CHARS = 64 * 1024 * 1024
+_file_cache: "OrderedDict[str, Tuple[Tuple[int, int], str]]" = OrderedDict()
+"""Maps paths to the ((mtime, size), text) of their last read, least recently used first."""
+_file_cache_chars = 0
+
+
+def read_file_cached(path: str, st: os.stat_result) -> str:
+    """Reads the text of the file at `path`, reusing the last read while its mtime and size match `st`.
+
+    The cache holds at most `_FILE_CACHE_MAX_CHARS` characters, evicting the least recently used files first.
+    """
+    global _file_cache_chars
+    version = (st.st_mtime_ns, st.st_size)
+    cached = _file_cache.get(path)
+    if cached is not None and cached[0] == version:
+        _file_cache.move_to_end(path)
+        return cached[1]
+    with open(path, "r") as f:
+        text = f.read()
+    if cached is not None:
+        del _file_cache[path]
+        _file_cache_chars -= len(cached[1])
+    if len(text) <= _FILE_CACHE_MAX_CHARS:
+        _file_cache[path] = (version, text)
+        _file_cache_chars += len(text)
+        while _file_cache_chars > _FILE_CACHE_MAX_CHARS:
+            _, (_, evicted) = _file_cache.popitem(last=False)
+            _file_cache_chars -= len(evicted)
+    return text
 
 
 def lookup_match(match: str, server: "Server") -> str:
-    logger.info("in lookup match")
     lsp_uri = "file://" + match
-    if lsp_uri in server.documents:
-        logger.info(f"[lookup_match] found in server {server.documents.keys()=}")
-        return server.documents[lsp_uri].text
-    else:
-        logger.info(f"[lookup_match] not found in server")
-        try:
-            if os.path.isdir(match):
-                logger.info("[lookup_match] match is dir")
-                return ""
-            else:
-                logger.info("[lookup_match] reading from filesystem")
-                try:
-                    with open(match, "r") as f:
-                        return f.read()
-                except:
-                    return ""
-        except:
+    document = server.documents.get(lsp_uri)
+    if document is not None:
+        logger.info("[lookup_match] found %s in server", lsp_uri)
+        return document.text
+    logger.info("[lookup_match] %s not found in server", lsp_uri)
+    try:
+        st = os.stat(match)
+        if stat.S_ISDIR(st.st_mode):
+            logger.info("[lookup_match] match is dir")
             return ""
+        return read_file_cached(match, st)
+    except:
+        return ""
 
 
 def replace_inline_uris(user_response: str, server: "Server") -> str:
-    matches = extract_uris(user_response)
-    for match in matches:
-        logger.info(f"[replace_inline_uris] found {match=}")
-        replacement = lookup_match(match, server)
-        user_response = user_response.replace(f"uri://{match}", "```" + replacement + "```")
-    return user_response
+    replacements: Dict[str, str] = {}
+    for match in extract_uris(user_response):
+        if match not in replacements:
+            logger.info(f"[replace_inline_uris] found {match=}")
+            replacements[f"uri://{match}"] = "```" + lookup_match(match, server) + "```"
+    if not replacements:
+        return user_response
+    # all of the uris are replaced in one pass; longer ones come first so a uri that is a prefix of another can't split it.
+    pattern = re.compile("|".join(map(re.escape, sorted(replacements, key=len, reverse=True))))
+    return pattern.sub(lambda m: replacements[m.group(0)], user_response)
 
 
 def resolve_inline_uris(user_response: str, server: "Server") -> List[lsp.Document]:
     logger.info(f"[resolve_inline_uris] {user_response=}")
     matches = extract_uris(user_response)
     result = []
+    # a uri mentioned more than once is only looked up once.
+    replacements: Dict[str, str] = {}
     for match in matches:
         logger.info(f"[resolve_inline_uris] looking for {match=}")
-        replacement = lookup_match(match, server)
+        replacement = replacements.get(match)
+        if replacement is None:
+            replacement = replacements[match] = lookup_match(match, server)
         # logger.info(f"[resolve_inline_uris] {match=} {replacement=}")
         result.append(lsp.Document(f"uri://{match}", lsp.DocumentContext(replacement)))
     # logger.info(f"[resolve_inline_uris] {result=}")
@@ -70,22 +106,15 @@ def contextual_prompt(
         # TODO add truncation logic
         ...
 
-    result = (
-        (
-            "Visible files:\n"
-            + "\n".join(
-                "`"
-                + doc.uri[len("uri://") :]
-                + "`\n===\n"
-                + "\n```\n"
-                + doc.document.text
-                + "```\n\n"
-                for doc in documents
-            )
-            + "\n"
-            f"{prompt}"
-        )
-        if documents
-        else prompt
-    )
-    return result
+    if not documents:
+        return prompt
+    # built as one list of fragments and joined once, rather than concatenating fragments per document.
+    prefix_len = len("uri://")
+    parts = ["Visible files:\n"]
+    for i, doc in enumerate(documents):
+        if i:
+            parts.append("\n")
+        parts.extend(("`", doc.uri[prefix_len:], "`\n===\n\n```\n", doc.document.text, "```\n\n"))
+    parts.append("\n")
+    parts.append(prompt)
+    return "".join(parts)
@@ -1,9 +1,11 @@
+import difflib
+import functools
 import os
+import pathlib
+import stat
 from dataclasses import dataclass
 from typing import Any, Dict, List, Optional, Tuple
 
-from diff_match_patch import diff_match_patch
-
 import rift.lsp.types as lsp
 from rift.lsp import (
     CreateFile,
@@ -14,6 +16,8 @@ from rift.lsp import (
     WorkspaceEdit,
 )
 from rift.lsp.types import ChangeAnnotation
+from rift.util.context import read_file_cached
+from rift.util.misc import utf16_len
 
 
 @dataclass
@@ -26,6 +30,12 @@ class FileChange:
     annotation_label: Optional[str] = None
 
 
+@functools.lru_cache(maxsize=1024)
+def _file_uri(path: str) -> str:
+    """Returns the percent-encoded file:// uri for the absolute `path`."""
+    return pathlib.Path(path).as_uri()
+
+
 def get_file_change(path: str, new_content: str) -> FileChange:
     """
     This function is used to generate a FileChange instance from a given file path and string of new content.
@@ -38,43 +48,65 @@ def get_file_change(path: str, new_content: str) -> FileChange:
     Returns:
     A FileChange instance that represents the changes to be made in the source file.
     """
-    uri = TextDocumentIdentifier(uri="file://" + path, version=0)
-    if os.path.isfile(path):
-        with open(path, "r") as f:
-            old_content = f.read()
-            return FileChange(uri=uri, old_content=old_content, new_content=new_content)
+    uri = TextDocumentIdentifier(uri=_file_uri(os.path.abspath(path)), version=0)
+    try:
+        st = os.stat(path)
+    except OSError:
+        st = None
+    if st is not None and stat.S_ISREG(st.st_mode):
+        # repeated changes to the same unmodified file reuse the last read instead of going back to disk.
+        old_content = read_file_cached(path, st)
+        return FileChange(uri=uri, old_content=old_content, new_content=new_content)
     else:
         return FileChange(uri=uri, old_content="", new_content=new_content, is_new_file=True)
 
 
+def _split_lines(text: str) -> List[str]:
+    """Splits `text` after each newline, keeping the newlines; positions here count lines the same way."""
+    lines = [line + "\n" for line in text.split("\n")]
+    last = lines.pop()
+    if len(last) > 1:
+        lines.append(last[:-1])
+    return lines
+
+
+def _changed_lines_edits(
+    old_content: str, new_content: str, annotation_label: str
+) -> List[TextEdit]:
+    """Returns a TextEdit for each run of lines that differs between `old_content` and `new_content`.
+
+    The edits are relative to `old_content` and don't overlap, so unchanged lines are never resent.
+    """
+    old_lines = _split_lines(old_content)
+    new_lines = _split_lines(new_content)
+    # the end of the old content, for hunks that run up to a last line without a newline.
+    if old_lines and not old_content.endswith("\n"):
+        eof = (len(old_lines) - 1, utf16_len(old_lines[-1]))
+    else:
+        eof = (len(old_lines), 0)
+    edits = []
+    matcher = difflib.SequenceMatcher(None, old_lines, new_lines)
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == "equal":
+            continue
+        end = eof if i2 == len(old_lines) else (i2, 0)
+        edits.append(
+            TextEdit(
+                Range.mk(i1, 0, *end), "".join(new_lines[j1:j2]), annotationId=annotation_label
+            )
+        )
+    return edits
+
+
 def edits_from_file_change(
     file_change: FileChange, user_confirmation: bool = False
 ) -> WorkspaceEdit:
-    dmp = diff_match_patch()
-    diff = dmp.diff_lineMode(file_change.old_content, file_change.new_content, None)
-    dmp.diff_cleanupSemantic(diff)
+    if not file_change.is_new_file and file_change.old_content == file_change.new_content:
+        return WorkspaceEdit(documentChanges=[], changeAnnotations={})
 
-    line = 0  # current line number
-    char = 0  # current character position within the line
-    edits = []  # list of TextEdit objects
     annotation_label = file_change.annotation_label or "rift"
 
-    new_text = ""
-
-    for op, text in diff:
-        if op == -1:  # remove
-            pass
-        elif op == 0:  # keep
-            new_text += text
-        elif op == 1:  # add
-            new_text += text
-
-    lines = file_change.old_content.split("\n")
-    edits = [
-        TextEdit(
-            Range.mk(0, 0, len(lines) - 1, len(lines[-1])), new_text, annotationId=annotation_label
-        )
-    ]
+    edits = _changed_lines_edits(file_change.old_content, file_change.new_content, annotation_label)
 
     documentChanges = []
 
@@ -112,13 +144,16 @@ def edits_from_file_changes(
     # Dictionary to store all change annotations.
     changeAnnotations: Dict[ChangeAnnotationIdentifier, ChangeAnnotation] = dict()
 
-    # Iterate through each file change.
+    # Iterate through each file change, skipping existing files whose content is unchanged.
     for file_change in file_changes:
+        if not file_change.is_new_file and file_change.old_content == file_change.new_content:
+            continue
+
         # Generate a WorkspaceEdit for this file change.
         edit = edits_from_file_change(file_change=file_change, user_confirmation=user_confirmation)
 
         # Add the document changes for this workspace edit to our list.
-        documentChanges += edit.documentChanges
+        documentChanges.extend(edit.documentChanges)
 
         # If any changeAnnotations were made in our workspace edit, update our dictionary with them.
         if edit.changeAnnotations is not None:
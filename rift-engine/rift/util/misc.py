@@ -1,16 +1,41 @@
-import contextlib
 import contextvars
 import logging
 import re
-from typing import Callable, TypeVar
+from typing import Callable, ContextManager, TypeVar
 
 T = TypeVar("T")
 
 logger = logging.getLogger(__name__)
 
 
-@contextlib.contextmanager
-def set_ctx(context_variable: contextvars.ContextVar[T], value: T):
+def utf16_len(text: str) -> int:
+    """The length of `text` in utf-16 code units, which is how LSP counts characters in a line."""
+    if text.isascii():
+        return len(text)
+    return len(text.encode("utf-16-le")) // 2
+
+
+class _SetCtx:
+    """Context manager that sets a context variable on entry and resets it on exit.
+
+    This is a plain class rather than a `contextlib.contextmanager` so that entering it doesn't allocate a generator.
+    """
+
+    __slots__ = ("context_variable", "value", "token")
+
+    def __init__(self, context_variable: contextvars.ContextVar, value):
+        self.context_variable = context_variable
+        self.value = value
+
+    def __enter__(self):
+        self.token = self.context_variable.set(self.value)
+        return self.value
+
+    def __exit__(self, *exc_info) -> None:
+        self.context_variable.reset(self.token)
+
+
+def set_ctx(context_variable: contextvars.ContextVar[T], value: T) -> ContextManager[T]:
     """
     Set the given context variable to the provided value.
 
@@ -18,15 +43,12 @@ def set_ctx(context_variable: contextvars.ContextVar[T], value: T):
         context_variable (contextvars.ContextVar): The context variable to set.
         value (T): The value to set the context variable to.
     """
-    old_value = context_variable.set(value)
-    try:
-        yield value
-    finally:
-        context_variable.reset(old_value)
+    return _SetCtx(context_variable, value)
 
 
-@contextlib.contextmanager
-def map_ctx(context_variable: contextvars.ContextVar[T], mapper: Callable[[T], T]):
+def map_ctx(
+    context_variable: contextvars.ContextVar[T], mapper: Callable[[T], T]
+) -> ContextManager[T]:
     """
     Map the value of the given context variable using the provided function.
 
@@ -37,7 +59,4 @@ def map_ctx(context_variable: contextvars.ContextVar[T], mapper: Callable[[T], T
     Yields:
         T: The mapped value of the context variable.
     """
-    old_value = context_variable.get()
-    new_value = mapper(old_value)
-    with set_ctx(context_variable, new_value):
-        yield new_value
+    return _SetCtx(context_variable, mapper(context_variable.get()))
@@ -10,7 +10,7 @@ from contextvars import ContextVar
 from dataclasses import fields, is_dataclass
 from datetime import datetime
 from enum import Enum
-from functools import singledispatch
+from functools import lru_cache, singledispatch
 from pathlib import Path
 from typing import Any, ClassVar, Literal, Optional, Type, TypeVar, Union, get_args, get_origin
 
@@ -38,6 +38,15 @@ def is_json_key(key: Any) -> TypeGuard[JsonKey]:
     return isinstance(key, (str, int, float, bool, type(None)))
 
 
+@lru_cache(maxsize=None)
+def _dataclass_fields(data_class_type: Type) -> tuple[tuple[str, Any, bool], ...]:
+    """The ``(name, type, is_optional)`` of each field of the dataclass, computed once per type."""
+    return tuple(
+        (field.name, field.type, field.type is not None and is_optional(field.type))
+        for field in fields(data_class_type)
+    )
+
+
 def ofdict_dataclass(data_class_type: Type[T], json_like_object: JsonLike) -> T:
     """
     Converts JSON-like object passed as a parameter to the specified data class type.
@@ -53,33 +62,30 @@ def ofdict_dataclass(data_class_type: Type[T], json_like_object: JsonLike) -> T:
     # Dictionary that will be constructed from json_like_object
     parsed_dict = {}
 
-    # Iterating over all the fields of the data class
-    for field in fields(data_class_type):
-        # Check if the json_like_object is dictionary
-        if not isinstance(json_like_object, dict):
-            raise OfDictError(
-                f"Error while decoding dataclass {data_class_type}, expected a dict but got {json_like_object} : {type(json_like_object)}"
-            )
-
-        # Fetch the field name
-        key = field.name
+    # Check if the json_like_object is dictionary
+    if not isinstance(json_like_object, dict):
+        raise OfDictError(
+            f"Error while decoding dataclass {data_class_type}, expected a dict but got {json_like_object} : {type(json_like_object)}"
+        )
 
+    # Iterating over all the fields of the data class
+    for key, field_type, optional in _dataclass_fields(data_class_type):
         # Check if the key is not in the json_like_object
         if key not in json_like_object:
             # Check if key's type is optional
-            if field.type is not None and is_optional(field.type):
+            if optional:
                 value = None
             else:
                 raise OfDictError(
-                    f"Missing {field.name} on input dict. Decoding {json_like_object} to type {data_class_type}."
+                    f"Missing {key} on input dict. Decoding {json_like_object} to type {data_class_type}."
                 )
         else:
             value = json_like_object[key]
 
         # Process the value if the type is defined for field
-        if field.type is not None:
+        if field_type is not None:
             with dpath(key):
-                parsed_dict[key] = ofdict(field.type, value)
+                parsed_dict[key] = ofdict(field_type, value)
         else:
             parsed_dict[key] = value
 
@@ -301,10 +307,9 @@ def validate(t: Type, item) -> bool:
 def todict_dataclass(x: Any):
     assert is_dataclass(x)
     r = {}
-    for field in fields(x):
-        k = field.name
+    for k, _, optional in _dataclass_fields(type(x)):
         v = getattr(x, k)
-        if is_optional(field.type) and v is None:
+        if optional and v is None:
             continue
         # [todo] shouldn't this not be recursive?
         r[k] = todict(v)
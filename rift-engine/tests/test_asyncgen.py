@@ -0,0 +1,111 @@
+import asyncio
+
+from rift.util.asyncgen import buffer, coalesce
+
+
+def test_buffer_early_break_stops_worker():
+    closed = []
+
+    async def source():
+        try:
+            for i in range(1000):
+                yield i
+        finally:
+            closed.append(True)
+
+    async def main():
+        before = asyncio.all_tasks()
+        b = buffer(source(), maxsize=4)
+        async for x in b:
+            if x == 2:
+                break
+        await asyncio.wait_for(b.aclose(), timeout=1)
+        assert asyncio.all_tasks() - before == set()
+        assert closed == [True]
+
+    asyncio.run(main())
+
+
+def test_buffer_reraises_source_error():
+    async def source():
+        yield 1
+        raise ValueError("boom")
+
+    async def main():
+        xs = []
+        try:
+            async for x in buffer(source(), maxsize=1):
+                xs.append(x)
+        except ValueError:
+            return xs
+        raise AssertionError("expected ValueError")
+
+    assert asyncio.run(main()) == [1]
+
+
+async def _collect(asg):
+    return [x async for x in asg]
+
+
+async def _from_list(xs, delay: float = 0.0):
+    for x in xs:
+        if delay:
+            await asyncio.sleep(delay)
+        yield x
+
+
+def test_coalesce_joins_until_max_len():
+    chunks = asyncio.run(_collect(coalesce(_from_list(["ab", "cd", "ef", "g"]), max_len=4, max_wait=1)))
+    assert chunks == ["abcd", "efg"]
+
+
+def test_coalesce_flushes_on_newline():
+    chunks = asyncio.run(_collect(coalesce(_from_list(["a", "b\n", "c"]), max_len=100, max_wait=1)))
+    assert chunks == ["ab\n", "c"]
+
+
+def test_coalesce_flushes_after_max_wait():
+    chunks = asyncio.run(
+        _collect(coalesce(_from_list(["a", "b"], delay=0.05), max_len=100, max_wait=0.01))
+    )
+    assert chunks == ["a", "b"]
+
+
+def test_coalesce_early_break_stops_worker():
+    closed = []
+
+    async def source():
+        try:
+            for i in range(1000):
+                yield f"{i}\n"
+                await asyncio.sleep(0)
+        finally:
+            closed.append(True)
+
+    async def main():
+        before = asyncio.all_tasks()
+        c = coalesce(source())
+        async for _ in c:
+            break
+        await c.aclose()
+        assert asyncio.all_tasks() - before == set()
+        assert closed == [True]
+
+    asyncio.run(main())
+
+
+def test_coalesce_reraises_source_error():
+    async def source():
+        yield "a\n"
+        raise ValueError("boom")
+
+    async def main():
+        xs = []
+        try:
+            async for x in coalesce(source()):
+                xs.append(x)
+        except ValueError:
+            return xs
+        raise AssertionError("expected ValueError")
+
+    assert asyncio.run(main()) == ["a\n"]
@@ -0,0 +1,20 @@
+import random
+
+from rift.lsp.document import DocumentContext, splice_line_offsets
+
+
+def _line_offsets(text: str) -> list:
+    return DocumentContext(text).line_offsets
+
+
+def test_splice_line_offsets_matches_full_recompute():
+    rng = random.Random(0)
+    alphabet = "ab\n\r xé"
+    for _ in range(50000):
+        old = "".join(rng.choice(alphabet) for _ in range(rng.randint(0, 12)))
+        start = rng.randint(0, len(old))
+        end = rng.randint(start, len(old))
+        new_text = "".join(rng.choice(alphabet) for _ in range(rng.randint(0, 4)))
+        text = old[:start] + new_text + old[end:]
+        spliced = splice_line_offsets(_line_offsets(old), start, end, new_text, text)
+        assert spliced == _line_offsets(text), (old, start, end, new_text)
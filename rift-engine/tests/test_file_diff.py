@@ -0,0 +1,57 @@
+import random
+
+from rift.util.file_diff import _changed_lines_edits
+from rift.util.misc import utf16_len
+
+
+def _offset(text: str, line: int, character: int) -> int:
+    lines = text.split("\n")
+    i = units = 0
+    while units < character:
+        units += utf16_len(lines[line][i])
+        i += 1
+    assert units == character and i <= len(lines[line])
+    return sum(len(l) + 1 for l in lines[:line]) + i
+
+
+def _apply(text: str, edits) -> str:
+    spans = []
+    for edit in edits:
+        start = _offset(text, edit.range.start.line, edit.range.start.character)
+        end = _offset(text, edit.range.end.line, edit.range.end.character)
+        assert start <= end
+        spans.append((start, end, edit.newText))
+    spans.sort()
+    # the edits are all relative to the old text, so they must not overlap.
+    for (_, end, _), (start, _, _) in zip(spans, spans[1:]):
+        assert end <= start
+    for start, end, new_text in reversed(spans):
+        text = text[:start] + new_text + text[end:]
+    return text
+
+
+def test_changed_lines_edits_turn_old_into_new():
+    rng = random.Random(0)
+    alphabet = ["a", "b", "\n", "\n", "\r\n", "", "😀", "é"]
+    for _ in range(20000):
+        old = "".join(rng.choice(alphabet) for _ in range(rng.randint(0, 10)))
+        new = "".join(rng.choice(alphabet) for _ in range(rng.randint(0, 10)))
+        edits = _changed_lines_edits(old, new, "rift")
+        assert all(edit.range.start.character == 0 for edit in edits)
+        assert _apply(old, edits) == new, (old, new, edits)
+
+
+def test_changed_lines_edits_skip_unchanged_lines():
+    old = "\n".join(f"line {i}" for i in range(10000))
+    new = old.replace("line 2\n", "LINE\n").replace("line 9000\n", "line 9000\nadded\n")
+    edits = _changed_lines_edits(old, new, "rift")
+    assert [(e.range.start.line, e.range.end.line, e.newText) for e in edits] == [
+        (2, 3, "LINE\n"),
+        (9001, 9001, "added\n"),
+    ]
+    assert _apply(old, edits) == new
+
+
+def test_changed_lines_edits_end_is_in_utf16_units():
+    [edit] = _changed_lines_edits("ab😀", "ab😀c", "rift")
+    assert (edit.range.end.line, edit.range.end.character) == (0, 4)
@@ -0,0 +1,45 @@
+import asyncio
+
+from rift.rpc import Transport, TransportClosedOK
+from rift.rpc.jsonrpc import InitializationMode, RpcServer, rpc_method
+
+
+class QueueTransport(Transport):
+    def __init__(self, inq: asyncio.Queue, outq: asyncio.Queue):
+        self.inq, self.outq = inq, outq
+
+    async def recv(self):
+        x = await self.inq.get()
+        if x is None:
+            raise TransportClosedOK("eof")
+        return x
+
+    async def send(self, data):
+        await self.outq.put(data)
+
+
+def test_notifications_start_in_order():
+    seen = []
+
+    class Server(RpcServer):
+        @rpc_method("slow")
+        async def slow(self, p):
+            seen.append("slow")
+            await asyncio.sleep(0.01)
+
+        @rpc_method("fast")
+        def fast(self, p):
+            seen.append("fast")
+
+    async def main():
+        inq, outq = asyncio.Queue(), asyncio.Queue()
+        server = Server(QueueTransport(inq, outq), init_mode=InitializationMode.NoInit)
+        listening = asyncio.create_task(server.listen_forever())
+        await inq.put(b'{"jsonrpc":"2.0","method":"slow","params":null}')
+        await inq.put(b'{"jsonrpc":"2.0","method":"fast","params":null}')
+        await asyncio.sleep(0.05)
+        await inq.put(None)
+        await listening
+
+    asyncio.run(main())
+    assert seen == ["slow", "fast"]
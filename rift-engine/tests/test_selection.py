@@ -0,0 +1,78 @@
+import random
+
+from rift.lsp.types import Position, Range, TextDocumentContentChangeEvent
+from rift.server.selection import RangeSet, _end_of_insert, _map_past_edit
+
+
+def _apply_edit_to_all(ranges, edit):
+    """Reference for `RangeSet.apply_edits`: maps every range through a single edit, without bisection."""
+    start, end = edit.range.start, edit.range.end
+    new_end = _end_of_insert(start, edit.text)
+    result = []
+    for range in ranges:
+        if end <= range.start:
+            result.append(
+                Range(_map_past_edit(range.start, end, new_end), _map_past_edit(range.end, end, new_end))
+            )
+        elif start >= range.end:
+            result.append(range)
+        else:
+            if start in range:
+                result.append(Range(range.start, start))
+            if end in range:
+                result.append(Range(new_end, _map_past_edit(range.end, end, new_end)))
+    return result
+
+
+def _positions(text: str) -> dict:
+    """Maps every position in `text`, with characters in utf-16 units, to its offset."""
+    positions = {}
+    offset = 0
+    for line, line_text in enumerate(text.split("\n")):
+        character = 0
+        for c in line_text:
+            positions[Position(line, character)] = offset
+            character += len(c.encode("utf-16-le")) // 2
+            offset += 1
+        positions[Position(line, character)] = offset
+        offset += 1
+    return positions
+
+
+def _random_range(rng: random.Random, positions: dict) -> Range:
+    a, b = sorted(rng.choices(list(positions), k=2))
+    return Range(a, b)
+
+
+def _apply(text: str, positions: dict, edit: TextDocumentContentChangeEvent) -> str:
+    return text[: positions[edit.range.start]] + edit.text + text[positions[edit.range.end] :]
+
+
+def test_apply_edits_matches_reference_in_document():
+    rng = random.Random(0)
+    for _ in range(20000):
+        text = "".join(rng.choice("ab\n😀") for _ in range(rng.randint(0, 20)))
+        positions = _positions(text)
+        ranges = RangeSet([_random_range(rng, positions) for _ in range(rng.randint(0, 6))])
+        expected = list(ranges)
+        edits = []
+        for _ in range(rng.randint(1, 3)):
+            edit = TextDocumentContentChangeEvent(
+                range=_random_range(rng, positions),
+                text="".join(rng.choice("xy\n😀") for _ in range(rng.randint(0, 3))),
+            )
+            new_text = _apply(text, positions, edit)
+            new_positions = _positions(new_text)
+            # ranges entirely outside the edit still cover the same text once mapped.
+            for before in expected:
+                if edit.range.end <= before.start or edit.range.start >= before.end:
+                    [after] = _apply_edit_to_all([before], edit)
+                    old_slice = text[positions[before.start] : positions[before.end]]
+                    new_slice = new_text[new_positions[after.start] : new_positions[after.end]]
+                    assert old_slice == new_slice
+            expected = _apply_edit_to_all(expected, edit)
+            edits.append(edit)
+            text, positions = new_text, new_positions
+        ranges.apply_edits(edits)
+        assert list(ranges) == expected
+        assert ranges._starts == [r.start for r in ranges]